@@ -1,9 +1,12 @@
 import os
-from typing import TypedDict, List, Union
+from typing import Annotated, Sequence, TypedDict
 from dotenv import load_dotenv
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from langgraph.graph.message import add_messages
 from langgraph.graph import StateGraph, START, END
 from langchain_groq import ChatGroq
+from history import HistoryCompactor
+from checkpointer import get_checkpointer, thread_config
 
 
 api = os.environ.get("GROQ_API_KEY")
@@ -12,30 +15,32 @@ load_dotenv()
 
 
 class AgentState(TypedDict):
-    messages: List[Union[HumanMessage, AIMessage]]
+    messages: Annotated[Sequence[BaseMessage], add_messages]
 
 llm = ChatGroq(model="meta-llama/llama-4-maverick-17b-128e-instruct")
+# Keeps each request bounded however long the conversation gets
+history = HistoryCompactor(llm)
 
 def process(state: AgentState) -> AgentState:
     """ This node will solve the request you input"""
-    response = llm.invoke(state["messages"])
-    state["messages"].append(AIMessage(content=response.content))
+    response = llm.invoke(history.compact(state["messages"]))
 
     print(f"\nAI: {response.content}")
-    return state
+    return {"messages": [AIMessage(content=response.content)]}
 
 graph = StateGraph(AgentState)
 graph.add_node("process", process)
 graph.add_edge(START, "process")
 graph.add_edge("process", END)
-agent = graph.compile()
+agent = graph.compile(checkpointer=get_checkpointer())
 
-converstional_his = []
+# The conversation lives in the checkpointer, so each turn only sends the new
+# message; run with THREAD_ID=<id> to pick a conversation back up
+config = thread_config()
+print(f"Conversation: {config['configurable']['thread_id']}")
 
 user_input = input("Enter: ")
 while user_input != "Exit":
-    converstional_his.append(HumanMessage(content=user_input))
-    result = agent.invoke({"messages": converstional_his})  
-    converstional_his = result["messages"]
+    agent.invoke({"messages": [HumanMessage(content=user_input)]}, config)
     user_input = input("Enter: ")
     
\ No newline at end of file
@@ -8,6 +8,7 @@ from langchain_core.tools import tool
 from langgraph.graph.message import add_messages
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
+from checkpointer import get_checkpointer, thread_config
 
 
 load_dotenv()
@@ -74,7 +75,7 @@ graph.add_conditional_edges(
 
 graph.add_edge("tools", "our_agent")
 
-app = graph.compile()
+app = graph.compile(checkpointer=get_checkpointer())
 def print_stream(stream):
     for s in stream:
         message = s["messages"][-1]
@@ -84,4 +85,4 @@ def print_stream(stream):
             message.pretty_print()
 
 inputs = {"messages": [HumanMessage(content="Add 3 + 3 and then multiply the result by 6.")]}
-print_stream(app.stream(inputs, stream_mode="values"))
\ No newline at end of file
+print_stream(app.stream(inputs, thread_config(), stream_mode="values"))
\ No newline at end of file
@@ -9,7 +9,10 @@ def search_car_rentals(
     price_tier: Optional[str] = None,
     start_date: Optional[Union[datetime, date]] = None,
     end_date: Optional[Union[datetime, date]] = None,
-) -> list[dict]:
+    fields: Optional[list[str]] = None,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+) -> dict:
     """
     Search for car rentals based on location, name, price tier, start date, and end date.
 
@@ -19,32 +22,24 @@ def search_car_rentals(
         price_tier (Optional[str]): The price tier of the car rental. Defaults to None.
         start_date (Optional[Union[datetime, date]]): The start date of the car rental. Defaults to None.
         end_date (Optional[Union[datetime, date]]): The end date of the car rental. Defaults to None.
+        fields (Optional[list[str]]): Only return these columns, e.g. ["id", "name"]. Defaults to None (all columns).
+        limit (int): The maximum number of results to return. Defaults to 10.
+        cursor (Optional[str]): The next_cursor of a previous result, to get the next page of the same search. Defaults to None.
 
     Returns:
-        list[dict]: A list of car rental dictionaries matching the search criteria.
+        dict: "results", a list of car rental dictionaries matching the search criteria, best matches first,
+            and "next_cursor", a token for the next page or None when there are no more results.
     """
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
-    query = "SELECT * FROM car_rentals WHERE 1=1"
-    params = []
-
-    if location:
-        query += " AND location LIKE ?"
-        params.append(f"%{location}%")
-    if name:
-        query += " AND name LIKE ?"
-        params.append(f"%{name}%")
+    match = fts_match(location=location, name=name)
     # For our tutorial, we will let you match on any dates and price tier.
     # (since our toy dataset doesn't have much data)
-    cursor.execute(query, params)
-    results = cursor.fetchall()
+    return search_page("car_rentals", match, fields, limit, cursor)
 
-    conn.close()
 
-    return [
-        dict(zip([column[0] for column in cursor.description], row)) for row in results
-    ]
+_book_car_rental_sql = tool_query("UPDATE car_rentals SET booked = 1 WHERE id = ?", (0,))
+_car_rental_start_sql = tool_query("UPDATE car_rentals SET start_date = ? WHERE id = ?", ("", 0))
+_car_rental_end_sql = tool_query("UPDATE car_rentals SET end_date = ? WHERE id = ?", ("", 0))
+_cancel_car_rental_sql = tool_query("UPDATE car_rentals SET booked = 0 WHERE id = ?", (0,))
 
 
 @tool
@@ -58,17 +53,12 @@ def book_car_rental(rental_id: int) -> str:
     Returns:
         str: A message indicating whether the car rental was successfully booked or not.
     """
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
-    cursor.execute("UPDATE car_rentals SET booked = 1 WHERE id = ?", (rental_id,))
-    conn.commit()
+    with pool.write("car_rentals") as cursor:
+        cursor.execute(_book_car_rental_sql, (rental_id,))
 
     if cursor.rowcount > 0:
-        conn.close()
         return f"Car rental {rental_id} successfully booked."
     else:
-        conn.close()
         return f"No car rental found with ID {rental_id}."
 
 
@@ -89,26 +79,15 @@ def update_car_rental(
     Returns:
         str: A message indicating whether the car rental was successfully updated or not.
     """
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
-    if start_date:
-        cursor.execute(
-            "UPDATE car_rentals SET start_date = ? WHERE id = ?",
-            (start_date, rental_id),
-        )
-    if end_date:
-        cursor.execute(
-            "UPDATE car_rentals SET end_date = ? WHERE id = ?", (end_date, rental_id)
-        )
-
-    conn.commit()
+    with pool.write("car_rentals") as cursor:
+        if start_date:
+            cursor.execute(_car_rental_start_sql, (start_date, rental_id))
+        if end_date:
+            cursor.execute(_car_rental_end_sql, (end_date, rental_id))
 
     if cursor.rowcount > 0:
-        conn.close()
         return f"Car rental {rental_id} successfully updated."
     else:
-        conn.close()
         return f"No car rental found with ID {rental_id}."
 
 
@@ -123,15 +102,18 @@ def cancel_car_rental(rental_id: int) -> str:
     Returns:
         str: A message indicating whether the car rental was successfully cancelled or not.
     """
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
-    cursor.execute("UPDATE car_rentals SET booked = 0 WHERE id = ?", (rental_id,))
-    conn.commit()
+    with pool.write("car_rentals") as cursor:
+        cursor.execute(_cancel_car_rental_sql, (rental_id,))
 
     if cursor.rowcount > 0:
-        conn.close()
         return f"Car rental {rental_id} successfully cancelled."
     else:
-        conn.close()
-        return f"No car rental found with ID {rental_id}."
\ No newline at end of file
+        return f"No car rental found with ID {rental_id}."
+
+
+# Async variants, run on the shared DB executor; ToolNode uses them automatically
+# when the graph is invoked asynchronously
+asearch_car_rentals = with_async(search_car_rentals)
+abook_car_rental = with_async(book_car_rental)
+aupdate_car_rental = with_async(update_car_rental)
+acancel_car_rental = with_async(cancel_car_rental)
@@ -0,0 +1,489 @@
+import asyncio
+import base64
+import contextvars
+import functools
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional
+
+
+class ConnectionPool:
+    """Shared SQLite connections for the travel tools.
+
+    Reads check out one of at most ``max_readers`` long-lived connections and
+    hand it back afterwards, so repeated tool calls hit a warm page cache
+    instead of reopening the file, however many threads the calls come from.
+    The most recently used connection is handed out first. All writes go
+    through a single writer connection guarded by a lock, which is how SQLite
+    wants to be used anyway (one writer at a time). The database is switched to
+    WAL mode so readers never block the writer and vice versa.
+
+    Each table also has a version number that goes up whenever a write to it
+    commits, so cached reads can tell when they are out of date.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        cache_size_kib: int = 64 * 1024,
+        mmap_size: int = 256 * 1024 * 1024,
+        busy_timeout_ms: int = 5000,
+        max_readers: int = 8,
+    ):
+        self._path = path
+        self._pragmas = (
+            "PRAGMA synchronous = NORMAL",
+            f"PRAGMA cache_size = -{cache_size_kib}",
+            f"PRAGMA mmap_size = {mmap_size}",
+            "PRAGMA temp_store = MEMORY",
+            f"PRAGMA busy_timeout = {busy_timeout_ms}",
+        )
+        self._write_lock = threading.RLock()
+        self._writer = None
+        self._readers = threading.BoundedSemaphore(max_readers)
+        # Idle reader connections with the generation they were opened in
+        self._idle = []
+        self._idle_lock = threading.Lock()
+        self._generation = 0
+        self._versions = {}
+        self._touched = set()
+
+        # journal_mode is persistent, so it only needs to be set once per file
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.close()
+
+    def _connect(self, **kwargs) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._path, check_same_thread=False, **kwargs)
+        for pragma in self._pragmas:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def read(self):
+        """Yield a cursor on a pooled reader connection.
+
+        Blocks while all ``max_readers`` connections are in use.
+        """
+        with self._readers:
+            with self._idle_lock:
+                conn, generation = self._idle.pop() if self._idle else (None, None)
+            if conn is None:
+                generation = self._generation
+                conn = self._connect()
+                conn.execute("PRAGMA query_only = ON")
+            cursor = conn.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+                with self._idle_lock:
+                    # Connections to a file replaced since (see ``close``) are dropped
+                    if generation == self._generation:
+                        self._idle.append((conn, generation))
+                        conn = None
+                if conn is not None:
+                    conn.close()
+
+    def version(self, table: str) -> tuple:
+        """Current version of ``table``; changes after every committed write to it."""
+        return self._generation, self._versions.get(table, 0)
+
+    @contextmanager
+    def write(self, *tables: str):
+        """Yield a cursor inside an exclusive write transaction.
+
+        The transaction is committed when the block exits normally and rolled
+        back if it raises. ``tables`` names the tables the block may modify;
+        their versions are bumped once the transaction commits.
+        """
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect(isolation_level=None)
+            conn = self._writer
+            self._touched.update(tables)
+            if conn.in_transaction:
+                # Nested use from the same thread joins the outer transaction
+                cursor = conn.cursor()
+                try:
+                    yield cursor
+                finally:
+                    cursor.close()
+                return
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+                # Bump only after the commit, so a reader that sees the new
+                # version is guaranteed to see the new data too
+                for table in self._touched:
+                    self._versions[table] = self._versions.get(table, 0) + 1
+            finally:
+                self._touched.clear()
+                cursor.close()
+
+    def invalidate(self):
+        """Change every table version and forget cached table columns.
+
+        Call this after the file was rewritten without going through the pool,
+        e.g. by ``reset_db`` or ``update_dates``.
+        """
+        with self._idle_lock:
+            for conn, _ in self._idle:
+                conn.close()
+            self._idle.clear()
+            self._generation += 1
+        _columns.clear()
+
+    def close(self):
+        """Close every pooled connection.
+
+        Call this before replacing the database file (e.g. ``update_dates``);
+        new connections are opened lazily on the next call, and readers in use
+        right now are closed when they are handed back. Every table version
+        changes too, so nothing cached from the old file is served again.
+        """
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+            self._writer = None
+            self.invalidate()
+
+
+# Every statement the tools run, with example parameters; see check_query_plans
+tool_queries = []
+
+
+def tool_query(query: str, example_params=()) -> str:
+    """Register a tool's SQL with ``check_query_plans`` and return it unchanged.
+
+    Tools build their statements through this (or through a helper whose
+    variants are registered), so the check covers exactly what they execute.
+    """
+    tool_queries.append((query, example_params))
+    return query
+
+
+def check_query_plans(file):
+    """Fail if any registered tool query would fall back to a full table scan.
+
+    Plans depend on the data and its statistics, so this is not run on
+    import. Run ``check_query_plans(db)`` after changing a tool's SQL or the
+    indexes in make_data.py.
+    """
+    conn = sqlite3.connect(file)
+    offenders = []
+    for query, params in tool_queries:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+        # FTS5 lookups show up as "SCAN <table> VIRTUAL TABLE INDEX ...", and a
+        # SELECT without FROM as "SCAN CONSTANT ROW"
+        scans = [
+            row[3]
+            for row in plan
+            if row[3].startswith("SCAN ")
+            and "VIRTUAL TABLE" not in row[3]
+            and row[3] != "SCAN CONSTANT ROW"
+        ]
+        if scans:
+            offenders.append(f"{' '.join(query.split())}\n    -> {'; '.join(scans)}")
+    conn.close()
+    if offenders:
+        raise RuntimeError("Full table scan in tool queries:\n" + "\n".join(offenders))
+
+
+def _fts_phrase(text: str) -> str:
+    # Quote every word so user input can never be parsed as FTS5 syntax, and
+    # prefix-match it so "Bas" still finds "Basel".
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text.lower()))
+
+
+def fts_match(**columns) -> Optional[str]:
+    """Build an FTS5 MATCH expression from column filters.
+
+    Every given column has to match. A list value matches when any of its
+    entries does. Returns an empty string when there is nothing to match on,
+    and None when a filter has no words in it (e.g. "***"), so no row matches.
+    """
+    clauses = []
+    for column, value in columns.items():
+        if not value:
+            continue
+        alternatives = value if isinstance(value, list) else [value]
+        phrases = [_fts_phrase(alternative) for alternative in alternatives]
+        phrases = [f"({phrase})" for phrase in phrases if phrase]
+        if not phrases:
+            return None
+        clauses.append(f"{column} : ({' OR '.join(phrases)})")
+    return " AND ".join(clauses)
+
+
+class SearchCache:
+    """Process-wide LRU of search results, shared by every conversation.
+
+    Entries are keyed by (table, query parameters, table version). A committed
+    write bumps the table's version, so results from before it are never looked
+    up again and simply age out. Cached results are shared between callers and
+    must not be mutated.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, table: str, params: tuple, compute):
+        """Return the cached result for ``params``, or store and return ``compute()``."""
+        # Read the version before querying: if a write commits meanwhile, the
+        # result is filed under the old version and never served afterwards
+        key = (table, params, pool.version(table))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        result = compute()
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return result
+
+
+# Upper bound on the rows one search call may return, whatever limit the model asks for
+max_search_limit = 50
+_columns = {}
+
+
+def table_columns(table: str) -> tuple:
+    """Column names of ``table``, read once and reused for every row."""
+    columns = _columns.get(table)
+    if columns is None:
+        with pool.read() as cursor:
+            cursor.execute(f"SELECT * FROM {table} LIMIT 0")
+            columns = tuple(column[0] for column in cursor.description)
+        _columns[table] = columns
+    return columns
+
+
+def _search_fingerprint(table: str, match: str) -> str:
+    return hashlib.sha256(f"{table}\0{match}".encode()).hexdigest()[:12]
+
+
+def encode_cursor(table: str, match: str, score: Optional[float], last_id: int) -> str:
+    """Opaque continuation token pointing just past the row ``last_id``."""
+    payload = [_search_fingerprint(table, match), score, last_id]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, table: str, match: str) -> tuple:
+    """Return ``(score, last_id)`` from a token made by the same search."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        fingerprint, score, last_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor. Pass next_cursor from a previous result unchanged.")
+    if fingerprint != _search_fingerprint(table, match):
+        raise ValueError("This cursor belongs to a different search. Repeat the search without it.")
+    return score, last_id
+
+
+def search_page(
+    table: str,
+    match: Optional[str],
+    fields: Optional[list[str]] = None,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+) -> dict:
+    """One page of ``table`` rows, best FTS matches first.
+
+    Without a match expression rows come in ID order; with None (see
+    ``fts_match``) there are no results. Pages are cut by keyset
+    (the last row's score and ID) rather than OFFSET, so later pages cost the
+    same as the first. Pages are served from ``search_cache`` until a write to
+    ``table`` commits.
+
+    Returns ``{"results": [...], "next_cursor": token}``; ``next_cursor`` is
+    None on the last page.
+    """
+    columns = table_columns(table)
+    if fields:
+        unknown = [field for field in fields if field not in columns]
+        if unknown:
+            raise ValueError(
+                f"Unknown fields {unknown}. Available fields: {', '.join(columns)}"
+            )
+        columns = tuple(dict.fromkeys(fields))
+    if match is None:
+        return {"results": [], "next_cursor": None}
+    limit = max(1, min(limit, max_search_limit))
+    return search_cache.get(
+        table,
+        (match, columns, limit, cursor),
+        lambda: _search_page(table, match, columns, limit, cursor),
+    )
+
+
+def _search_query(table: str, projection: str, match: bool, after: bool) -> str:
+    """The SQL behind one ``search_page`` call; ``after`` adds the keyset condition."""
+    if match:
+        fts = f"{table}_fts"
+        query = (
+            f"SELECT {projection}, t.id, bm25({fts}) AS score FROM {fts}"
+            f" JOIN {table} t ON t.id = {fts}.rowid"
+            f" WHERE {fts} MATCH ?"
+        )
+        if after:
+            query += " AND (score > ? OR (score = ? AND t.id > ?))"
+        return query + " ORDER BY score, t.id LIMIT ?"
+    query = f"SELECT {projection}, t.id, NULL FROM {table} t"
+    if after:
+        query += " WHERE t.id > ?"
+    return query + " ORDER BY t.id LIMIT ?"
+
+
+# The first page of an unfiltered search reads the first rows by ID and needs
+# no index, so it is left out
+for _table in search_indexes:
+    tool_query(_search_query(_table, "t.*", True, False), ('"x"*', 11))
+    tool_query(_search_query(_table, "t.*", True, True), ('"x"*', 0.0, 0.0, 0, 11))
+    tool_query(_search_query(_table, "t.*", False, True), (0, 11))
+
+
+def _search_page(table: str, match: str, columns: tuple, limit: int, cursor: Optional[str]) -> dict:
+    projection = ", ".join(f"t.{column}" for column in columns)
+    query = _search_query(table, projection, bool(match), bool(cursor))
+    params = [match] if match else []
+    if cursor:
+        score, last_id = decode_cursor(cursor, table, match)
+        params += [score, score, last_id] if match else [last_id]
+    # One extra row tells us whether there is another page
+    params.append(limit + 1)
+
+    with pool.read() as db_cursor:
+        db_cursor.execute(query, params)
+        rows = db_cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        *_, last_id, score = rows[-1]
+        next_cursor = encode_cursor(table, match, score, last_id)
+    width = len(columns)
+    return {
+        "results": [dict(zip(columns, row[:width])) for row in rows],
+        "next_cursor": next_cursor,
+    }
+
+
+class DBExecutor:
+    """Runs blocking database calls off the event loop.
+
+    A fixed set of worker threads does the work on warm reader connections
+    from ``pool``. At most ``max_queued`` calls may wait for a
+    worker. Beyond that, callers wait before submitting, in arrival order and
+    without polling, so a burst of conversations cannot pile up unbounded work
+    behind a slow query.
+    """
+
+    def __init__(self, max_workers: int = 8, max_queued: int = 64):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="db"
+        )
+        # asyncio primitives belong to one event loop, so each loop gets its own
+        self._slots = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+
+    async def run(self, fn, *args, **kwargs):
+        """Await ``fn(*args, **kwargs)`` run on a database worker thread."""
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:
+            slots = self._slots[loop] = asyncio.Semaphore(self.max_workers + self.max_queued)
+        # Backpressure: wait for a free slot without blocking the event loop
+        await slots.acquire()
+        submitted = time.monotonic()
+        with self._lock:
+            self.queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queued)
+
+        def call():
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.total_wait += time.monotonic() - submitted
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        def done(future):
+            # A call cancelled while still queued never ran
+            if future.cancelled():
+                with self._lock:
+                    self.queued -= 1
+            # The slot is only free once the work is, even if the caller gave up
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(slots.release)
+
+        # Carry the caller's context (tracing, callbacks) into the worker
+        future = self._executor.submit(contextvars.copy_context().run, call)
+        future.add_done_callback(done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "max_queue_depth": self.max_queue_depth,
+                "avg_wait_ms": 1000 * self.total_wait / max(self.completed, 1),
+            }
+
+
+def with_async(sync_tool):
+    """Give a sync ``@tool`` an async path that runs it on ``db_executor``.
+
+    ``ToolNode`` then awaits the coroutine when the graph runs asynchronously
+    and keeps calling the function when it runs synchronously. Returns the
+    coroutine so it can also be called directly.
+    """
+
+    @functools.wraps(sync_tool.func)
+    async def coroutine(*args, **kwargs):
+        return await db_executor.run(sync_tool.func, *args, **kwargs)
+
+    coroutine.__name__ = f"a{sync_tool.func.__name__}"
+    sync_tool.coroutine = coroutine
+    return coroutine
+
+
+pool = ConnectionPool(db)
+db_executor = DBExecutor()
+search_cache = SearchCache()
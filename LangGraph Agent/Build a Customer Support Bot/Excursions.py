@@ -3,7 +3,10 @@ def search_trip_recommendations(
     location: Optional[str] = None,
     name: Optional[str] = None,
     keywords: Optional[str] = None,
-) -> list[dict]:
+    fields: Optional[list[str]] = None,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+) -> dict:
     """
     Search for trip recommendations based on location, name, and keywords.
 
@@ -11,36 +14,25 @@ def search_trip_recommendations(
         location (Optional[str]): The location of the trip recommendation. Defaults to None.
         name (Optional[str]): The name of the trip recommendation. Defaults to None.
         keywords (Optional[str]): The keywords associated with the trip recommendation. Defaults to None.
+        fields (Optional[list[str]]): Only return these columns, e.g. ["id", "name"]. Defaults to None (all columns).
+        limit (int): The maximum number of results to return. Defaults to 10.
+        cursor (Optional[str]): The next_cursor of a previous result, to get the next page of the same search. Defaults to None.
 
     Returns:
-        list[dict]: A list of trip recommendation dictionaries matching the search criteria.
+        dict: "results", a list of trip recommendation dictionaries matching the search criteria, best matches first,
+            and "next_cursor", a token for the next page or None when there are no more results.
     """
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
-    query = "SELECT * FROM trip_recommendations WHERE 1=1"
-    params = []
-
-    if location:
-        query += " AND location LIKE ?"
-        params.append(f"%{location}%")
-    if name:
-        query += " AND name LIKE ?"
-        params.append(f"%{name}%")
-    if keywords:
-        keyword_list = keywords.split(",")
-        keyword_conditions = " OR ".join(["keywords LIKE ?" for _ in keyword_list])
-        query += f" AND ({keyword_conditions})"
-        params.extend([f"%{keyword.strip()}%" for keyword in keyword_list])
-
-    cursor.execute(query, params)
-    results = cursor.fetchall()
+    match = fts_match(
+        location=location,
+        name=name,
+        keywords=keywords.split(",") if keywords else None,
+    )
+    return search_page("trip_recommendations", match, fields, limit, cursor)
 
-    conn.close()
 
-    return [
-        dict(zip([column[0] for column in cursor.description], row)) for row in results
-    ]
+_book_excursion_sql = tool_query("UPDATE trip_recommendations SET booked = 1 WHERE id = ?", (0,))
+_excursion_details_sql = tool_query("UPDATE trip_recommendations SET details = ? WHERE id = ?", ("", 0))
+_cancel_excursion_sql = tool_query("UPDATE trip_recommendations SET booked = 0 WHERE id = ?", (0,))
 
 
 @tool
@@ -54,19 +46,12 @@ def book_excursion(recommendation_id: int) -> str:
     Returns:
         str: A message indicating whether the trip recommendation was successfully booked or not.
     """
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "UPDATE trip_recommendations SET booked = 1 WHERE id = ?", (recommendation_id,)
-    )
-    conn.commit()
+    with pool.write("trip_recommendations") as cursor:
+        cursor.execute(_book_excursion_sql, (recommendation_id,))
 
     if cursor.rowcount > 0:
-        conn.close()
         return f"Trip recommendation {recommendation_id} successfully booked."
     else:
-        conn.close()
         return f"No trip recommendation found with ID {recommendation_id}."
 
 
@@ -82,20 +67,12 @@ def update_excursion(recommendation_id: int, details: str) -> str:
     Returns:
         str: A message indicating whether the trip recommendation was successfully updated or not.
     """
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "UPDATE trip_recommendations SET details = ? WHERE id = ?",
-        (details, recommendation_id),
-    )
-    conn.commit()
+    with pool.write("trip_recommendations") as cursor:
+        cursor.execute(_excursion_details_sql, (details, recommendation_id))
 
     if cursor.rowcount > 0:
-        conn.close()
         return f"Trip recommendation {recommendation_id} successfully updated."
     else:
-        conn.close()
         return f"No trip recommendation found with ID {recommendation_id}."
 
 
@@ -110,17 +87,18 @@ def cancel_excursion(recommendation_id: int) -> str:
     Returns:
         str: A message indicating whether the trip recommendation was successfully cancelled or not.
     """
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "UPDATE trip_recommendations SET booked = 0 WHERE id = ?", (recommendation_id,)
-    )
-    conn.commit()
+    with pool.write("trip_recommendations") as cursor:
+        cursor.execute(_cancel_excursion_sql, (recommendation_id,))
 
     if cursor.rowcount > 0:
-        conn.close()
         return f"Trip recommendation {recommendation_id} successfully cancelled."
     else:
-        conn.close()
-        return f"No trip recommendation found with ID {recommendation_id}."
\ No newline at end of file
+        return f"No trip recommendation found with ID {recommendation_id}."
+
+
+# Async variants, run on the shared DB executor; ToolNode uses them automatically
+# when the graph is invoked asynchronously
+asearch_trip_recommendations = with_async(search_trip_recommendations)
+abook_excursion = with_async(book_excursion)
+aupdate_excursion = with_async(update_excursion)
+acancel_excursion = with_async(cancel_excursion)
@@ -1,28 +1,11 @@
-import sqlite3
 from datetime import date, datetime
 from typing import Optional
 
-import pytz
 from langchain_core.runnables import RunnableConfig
 
 
-@tool
-def fetch_user_flight_information(config: RunnableConfig) -> list[dict]:
-    """Fetch all tickets for the user along with corresponding flight information and seat assignments.
-
-    Returns:
-        A list of dictionaries where each dictionary contains the ticket details,
-        associated flight details, and the seat assignments for each ticket belonging to the user.
+_user_tickets_sql = tool_query(
     """
-    configuration = config.get("configurable", {})
-    passenger_id = configuration.get("passenger_id", None)
-    if not passenger_id:
-        raise ValueError("No passenger ID configured.")
-
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
-    query = """
     SELECT 
         t.ticket_no, t.book_ref,
         f.flight_id, f.flight_no, f.departure_airport, f.arrival_airport, f.scheduled_departure, f.scheduled_arrival,
@@ -34,30 +17,37 @@ def fetch_user_flight_information(config: RunnableConfig) -> list[dict]:
         JOIN boarding_passes bp ON bp.ticket_no = t.ticket_no AND bp.flight_id = f.flight_id
     WHERE 
         t.passenger_id = ?
+    """,
+    ("",),
+)
+
+
+@tool
+def fetch_user_flight_information(config: RunnableConfig) -> list[dict]:
+    """Fetch all tickets for the user along with corresponding flight information and seat assignments.
+
+    Returns:
+        A list of dictionaries where each dictionary contains the ticket details,
+        associated flight details, and the seat assignments for each ticket belonging to the user.
     """
-    cursor.execute(query, (passenger_id,))
-    rows = cursor.fetchall()
-    column_names = [column[0] for column in cursor.description]
-    results = [dict(zip(column_names, row)) for row in rows]
+    configuration = config.get("configurable", {})
+    passenger_id = configuration.get("passenger_id", None)
+    if not passenger_id:
+        raise ValueError("No passenger ID configured.")
 
-    cursor.close()
-    conn.close()
+    with pool.read() as cursor:
+        cursor.execute(_user_tickets_sql, (passenger_id,))
+        rows = cursor.fetchall()
+        column_names = [column[0] for column in cursor.description]
+    results = [dict(zip(column_names, row)) for row in rows]
 
     return results
 
 
-@tool
-def search_flights(
-    departure_airport: Optional[str] = None,
-    arrival_airport: Optional[str] = None,
-    start_time: Optional[date | datetime] = None,
-    end_time: Optional[date | datetime] = None,
-    limit: int = 20,
-) -> list[dict]:
-    """Search for flights based on departure airport, arrival airport, and departure time range."""
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
+def _flight_search(
+    departure_airport=None, arrival_airport=None, start_time=None, end_time=None, limit=20
+) -> tuple[str, list]:
+    """The query and parameters of a ``search_flights`` call."""
     query = "SELECT * FROM flights WHERE 1 = 1"
     params = []
 
@@ -78,15 +68,93 @@ def search_flights(
         params.append(end_time)
     query += " LIMIT ?"
     params.append(limit)
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    column_names = [column[0] for column in cursor.description]
-    results = [dict(zip(column_names, row)) for row in rows]
+    return query, params
 
-    cursor.close()
-    conn.close()
 
-    return results
+# One search per index it should use; a search without any filter reads the
+# first rows of the table and needs no index
+for _filters in (
+    {"departure_airport": "x"},
+    {"arrival_airport": "x"},
+    {"departure_airport": "x", "arrival_airport": "x", "start_time": "x", "end_time": "x"},
+    {"start_time": "x", "end_time": "x"},
+):
+    tool_query(*_flight_search(**_filters))
+
+
+@tool
+def search_flights(
+    departure_airport: Optional[str] = None,
+    arrival_airport: Optional[str] = None,
+    start_time: Optional[date | datetime] = None,
+    end_time: Optional[date | datetime] = None,
+    limit: int = 20,
+) -> list[dict]:
+    """Search for flights based on departure airport, arrival airport, and departure time range."""
+    query, params = _flight_search(departure_airport, arrival_airport, start_time, end_time, limit)
+
+    def run_search():
+        with pool.read() as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            column_names = [column[0] for column in cursor.description]
+        return [dict(zip(column_names, row)) for row in rows]
+
+    return search_cache.get("flights", (query, tuple(params)), run_search)
+
+
+# The new flight has to leave at least 3 hours from now. SQLite's julianday()
+# honours the UTC offset stored with every departure.
+_departs_in_time = "julianday(scheduled_departure) >= julianday('now', '+3 hours')"
+
+
+_ticket_status_sql = tool_query(
+    "SELECT"
+    " (SELECT scheduled_departure FROM flights WHERE flight_id = :flight_id),"
+    f" (SELECT {_departs_in_time} FROM flights WHERE flight_id = :flight_id),"
+    " EXISTS (SELECT 1 FROM ticket_flights WHERE ticket_no = :ticket_no),"
+    " EXISTS (SELECT 1 FROM tickets WHERE ticket_no = :ticket_no AND passenger_id = :passenger_id)",
+    {"flight_id": 0, "ticket_no": "", "passenger_id": ""},
+)
+# Ownership and the 3-hour rule are part of the UPDATE itself, so the common
+# case is a single statement
+_change_ticket_sql = tool_query(
+    "UPDATE ticket_flights SET flight_id = :flight_id"
+    " WHERE ticket_no = :ticket_no"
+    " AND EXISTS (SELECT 1 FROM tickets"
+    " WHERE ticket_no = :ticket_no AND passenger_id = :passenger_id)"
+    f" AND EXISTS (SELECT 1 FROM flights WHERE flight_id = :flight_id AND {_departs_in_time})",
+    {"flight_id": 0, "ticket_no": "", "passenger_id": ""},
+)
+_cancel_ticket_sql = tool_query(
+    "DELETE FROM ticket_flights WHERE ticket_no = :ticket_no"
+    " AND EXISTS (SELECT 1 FROM tickets"
+    " WHERE ticket_no = :ticket_no AND passenger_id = :passenger_id)",
+    {"ticket_no": "", "passenger_id": ""},
+)
+_reschedule_tickets_sql = tool_query(
+    "UPDATE ticket_flights SET flight_id = :new_flight_id"
+    " WHERE flight_id = :flight_id"
+    f" AND EXISTS (SELECT 1 FROM flights WHERE flight_id = :new_flight_id AND {_departs_in_time})",
+    {"flight_id": 0, "new_flight_id": 0},
+)
+# Seats move with the tickets, or the moved tickets drop out of
+# fetch_user_flight_information's join
+_reschedule_boarding_passes_sql = tool_query(
+    "UPDATE boarding_passes SET flight_id = :new_flight_id"
+    " WHERE flight_id = :flight_id AND ticket_no IN"
+    " (SELECT ticket_no FROM ticket_flights WHERE flight_id = :new_flight_id)",
+    {"flight_id": 0, "new_flight_id": 0},
+)
+
+
+def _ticket_status(cursor, ticket_no: str, passenger_id: str, new_flight_id: Optional[int] = None):
+    """Why a ticket change matched no rows: (new departure, departs in time, ticket exists, owned)."""
+    cursor.execute(
+        _ticket_status_sql,
+        {"flight_id": new_flight_id, "ticket_no": ticket_no, "passenger_id": passenger_id},
+    )
+    return cursor.fetchone()
 
 
 @tool
@@ -99,63 +167,29 @@ def update_ticket_to_new_flight(
     if not passenger_id:
         raise ValueError("No passenger ID configured.")
 
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "SELECT departure_airport, arrival_airport, scheduled_departure FROM flights WHERE flight_id = ?",
-        (new_flight_id,),
-    )
-    new_flight = cursor.fetchone()
-    if not new_flight:
-        cursor.close()
-        conn.close()
-        return "Invalid new flight ID provided."
-    column_names = [column[0] for column in cursor.description]
-    new_flight_dict = dict(zip(column_names, new_flight))
-    timezone = pytz.timezone("Etc/GMT-3")
-    current_time = datetime.now(tz=timezone)
-    departure_time = datetime.strptime(
-        new_flight_dict["scheduled_departure"], "%Y-%m-%d %H:%M:%S.%f%z"
-    )
-    time_until = (departure_time - current_time).total_seconds()
-    if time_until < (3 * 3600):
-        return f"Not permitted to reschedule to a flight that is less than 3 hours from the current time. Selected flight is at {departure_time}."
-
-    cursor.execute(
-        "SELECT flight_id FROM ticket_flights WHERE ticket_no = ?", (ticket_no,)
-    )
-    current_flight = cursor.fetchone()
-    if not current_flight:
-        cursor.close()
-        conn.close()
-        return "No existing ticket found for the given ticket number."
-
-    # Check the signed-in user actually has this ticket
-    cursor.execute(
-        "SELECT * FROM tickets WHERE ticket_no = ? AND passenger_id = ?",
-        (ticket_no, passenger_id),
-    )
-    current_ticket = cursor.fetchone()
-    if not current_ticket:
-        cursor.close()
-        conn.close()
-        return f"Current signed-in passenger with ID {passenger_id} not the owner of ticket {ticket_no}"
-
     # In a real application, you'd likely add additional checks here to enforce business logic,
     # like "does the new departure airport match the current ticket", etc.
     # While it's best to try to be *proactive* in 'type-hinting' policies to the LLM
     # it's inevitably going to get things wrong, so you **also** need to ensure your
     # API enforces valid behavior
-    cursor.execute(
-        "UPDATE ticket_flights SET flight_id = ? WHERE ticket_no = ?",
-        (new_flight_id, ticket_no),
-    )
-    conn.commit()
+    with pool.write("ticket_flights") as cursor:
+        cursor.execute(
+            _change_ticket_sql,
+            {"flight_id": new_flight_id, "ticket_no": ticket_no, "passenger_id": passenger_id},
+        )
+        if cursor.rowcount > 0:
+            return "Ticket successfully updated to new flight."
+        departure, in_time, ticket_exists, owned = _ticket_status(
+            cursor, ticket_no, passenger_id, new_flight_id
+        )
 
-    cursor.close()
-    conn.close()
-    return "Ticket successfully updated to new flight."
+    if departure is None:
+        return "Invalid new flight ID provided."
+    if not in_time:
+        return f"Not permitted to reschedule to a flight that is less than 3 hours from the current time. Selected flight is at {departure}."
+    if not ticket_exists:
+        return "No existing ticket found for the given ticket number."
+    return f"Current signed-in passenger with ID {passenger_id} not the owner of ticket {ticket_no}"
 
 
 @tool
@@ -165,32 +199,65 @@ def cancel_ticket(ticket_no: str, *, config: RunnableConfig) -> str:
     passenger_id = configuration.get("passenger_id", None)
     if not passenger_id:
         raise ValueError("No passenger ID configured.")
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
+    with pool.write("ticket_flights") as cursor:
+        cursor.execute(
+            _cancel_ticket_sql, {"ticket_no": ticket_no, "passenger_id": passenger_id}
+        )
+        if cursor.rowcount > 0:
+            return "Ticket successfully cancelled."
+        _, _, ticket_exists, _ = _ticket_status(cursor, ticket_no, passenger_id)
 
-    cursor.execute(
-        "SELECT flight_id FROM ticket_flights WHERE ticket_no = ?", (ticket_no,)
-    )
-    existing_ticket = cursor.fetchone()
-    if not existing_ticket:
-        cursor.close()
-        conn.close()
+    if not ticket_exists:
         return "No existing ticket found for the given ticket number."
+    return f"Current signed-in passenger with ID {passenger_id} not the owner of ticket {ticket_no}"
 
-    # Check the signed-in user actually has this ticket
-    cursor.execute(
-        "SELECT ticket_no FROM tickets WHERE ticket_no = ? AND passenger_id = ?",
-        (ticket_no, passenger_id),
-    )
-    current_ticket = cursor.fetchone()
-    if not current_ticket:
-        cursor.close()
-        conn.close()
-        return f"Current signed-in passenger with ID {passenger_id} not the owner of ticket {ticket_no}"
-
-    cursor.execute("DELETE FROM ticket_flights WHERE ticket_no = ?", (ticket_no,))
-    conn.commit()
-
-    cursor.close()
-    conn.close()
-    return "Ticket successfully cancelled."
\ No newline at end of file
+
+# Role in the configurable of a run allowed to move every passenger of a flight
+operator_role = "operations"
+
+
+@tool
+def reschedule_flight(flight_id: int, new_flight_id: int, *, config: RunnableConfig) -> str:
+    """Move every ticket on a disrupted flight to a new flight at once.
+
+    This acts on all passengers of the flight, so it only runs for the
+    operations role, never for a signed-in passenger.
+
+    Args:
+        flight_id (int): The ID of the disrupted flight.
+        new_flight_id (int): The ID of the flight to move its tickets to. It must leave at least 3 hours from now.
+
+    Returns:
+        str: How many tickets were moved, or why none could be.
+    """
+    configuration = config.get("configurable", {})
+    if configuration.get("role") != operator_role:
+        raise ValueError(f"Rescheduling a whole flight needs the {operator_role!r} role.")
+    if flight_id == new_flight_id:
+        return "The new flight must be a different flight."
+
+    params = {"flight_id": flight_id, "new_flight_id": new_flight_id}
+    with pool.write("ticket_flights", "boarding_passes") as cursor:
+        cursor.execute(_reschedule_tickets_sql, params)
+        moved = cursor.rowcount
+        if moved:
+            cursor.execute(_reschedule_boarding_passes_sql, params)
+        else:
+            departure, in_time, _, _ = _ticket_status(cursor, "", "", new_flight_id)
+
+    if moved:
+        return f"{moved} tickets moved from flight {flight_id} to flight {new_flight_id}."
+    if departure is None:
+        return "Invalid new flight ID provided."
+    if not in_time:
+        return f"Not permitted to reschedule to a flight that is less than 3 hours from the current time. Selected flight is at {departure}."
+    return f"No tickets found on flight {flight_id}."
+
+
+# Async variants, run on the shared DB executor; ToolNode uses them automatically
+# when the graph is invoked asynchronously
+afetch_user_flight_information = with_async(fetch_user_flight_information)
+asearch_flights = with_async(search_flights)
+aupdate_ticket_to_new_flight = with_async(update_ticket_to_new_flight)
+acancel_ticket = with_async(cancel_ticket)
+areschedule_flight = with_async(reschedule_flight)
@@ -5,7 +5,10 @@ def search_hotels(
     price_tier: Optional[str] = None,
     checkin_date: Optional[Union[datetime, date]] = None,
     checkout_date: Optional[Union[datetime, date]] = None,
-) -> list[dict]:
+    fields: Optional[list[str]] = None,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+) -> dict:
     """
     Search for hotels based on location, name, price tier, check-in date, and check-out date.
 
@@ -15,31 +18,23 @@ def search_hotels(
         price_tier (Optional[str]): The price tier of the hotel. Defaults to None. Examples: Midscale, Upper Midscale, Upscale, Luxury
         checkin_date (Optional[Union[datetime, date]]): The check-in date of the hotel. Defaults to None.
         checkout_date (Optional[Union[datetime, date]]): The check-out date of the hotel. Defaults to None.
+        fields (Optional[list[str]]): Only return these columns, e.g. ["id", "name"]. Defaults to None (all columns).
+        limit (int): The maximum number of results to return. Defaults to 10.
+        cursor (Optional[str]): The next_cursor of a previous result, to get the next page of the same search. Defaults to None.
 
     Returns:
-        list[dict]: A list of hotel dictionaries matching the search criteria.
+        dict: "results", a list of hotel dictionaries matching the search criteria, best matches first,
+            and "next_cursor", a token for the next page or None when there are no more results.
     """
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
-    query = "SELECT * FROM hotels WHERE 1=1"
-    params = []
-
-    if location:
-        query += " AND location LIKE ?"
-        params.append(f"%{location}%")
-    if name:
-        query += " AND name LIKE ?"
-        params.append(f"%{name}%")
+    match = fts_match(location=location, name=name)
     # For the sake of this tutorial, we will let you match on any dates and price tier.
-    cursor.execute(query, params)
-    results = cursor.fetchall()
+    return search_page("hotels", match, fields, limit, cursor)
 
-    conn.close()
 
-    return [
-        dict(zip([column[0] for column in cursor.description], row)) for row in results
-    ]
+_book_hotel_sql = tool_query("UPDATE hotels SET booked = 1 WHERE id = ?", (0,))
+_hotel_checkin_sql = tool_query("UPDATE hotels SET checkin_date = ? WHERE id = ?", ("", 0))
+_hotel_checkout_sql = tool_query("UPDATE hotels SET checkout_date = ? WHERE id = ?", ("", 0))
+_cancel_hotel_sql = tool_query("UPDATE hotels SET booked = 0 WHERE id = ?", (0,))
 
 
 @tool
@@ -53,17 +48,12 @@ def book_hotel(hotel_id: int) -> str:
     Returns:
         str: A message indicating whether the hotel was successfully booked or not.
     """
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
-    cursor.execute("UPDATE hotels SET booked = 1 WHERE id = ?", (hotel_id,))
-    conn.commit()
+    with pool.write("hotels") as cursor:
+        cursor.execute(_book_hotel_sql, (hotel_id,))
 
     if cursor.rowcount > 0:
-        conn.close()
         return f"Hotel {hotel_id} successfully booked."
     else:
-        conn.close()
         return f"No hotel found with ID {hotel_id}."
 
 
@@ -84,26 +74,15 @@ def update_hotel(
     Returns:
         str: A message indicating whether the hotel was successfully updated or not.
     """
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
-    if checkin_date:
-        cursor.execute(
-            "UPDATE hotels SET checkin_date = ? WHERE id = ?", (checkin_date, hotel_id)
-        )
-    if checkout_date:
-        cursor.execute(
-            "UPDATE hotels SET checkout_date = ? WHERE id = ?",
-            (checkout_date, hotel_id),
-        )
-
-    conn.commit()
+    with pool.write("hotels") as cursor:
+        if checkin_date:
+            cursor.execute(_hotel_checkin_sql, (checkin_date, hotel_id))
+        if checkout_date:
+            cursor.execute(_hotel_checkout_sql, (checkout_date, hotel_id))
 
     if cursor.rowcount > 0:
-        conn.close()
         return f"Hotel {hotel_id} successfully updated."
     else:
-        conn.close()
         return f"No hotel found with ID {hotel_id}."
 
 
@@ -118,15 +97,18 @@ def cancel_hotel(hotel_id: int) -> str:
     Returns:
         str: A message indicating whether the hotel was successfully cancelled or not.
     """
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
-    cursor.execute("UPDATE hotels SET booked = 0 WHERE id = ?", (hotel_id,))
-    conn.commit()
+    with pool.write("hotels") as cursor:
+        cursor.execute(_cancel_hotel_sql, (hotel_id,))
 
     if cursor.rowcount > 0:
-        conn.close()
         return f"Hotel {hotel_id} successfully cancelled."
     else:
-        conn.close()
-        return f"No hotel found with ID {hotel_id}."
\ No newline at end of file
+        return f"No hotel found with ID {hotel_id}."
+
+
+# Async variants, run on the shared DB executor; ToolNode uses them automatically
+# when the graph is invoked asynchronously
+asearch_hotels = with_async(search_hotels)
+abook_hotel = with_async(book_hotel)
+aupdate_hotel = with_async(update_hotel)
+acancel_hotel = with_async(cancel_hotel)
@@ -0,0 +1,110 @@
+from collections import defaultdict
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+# Table and date columns booked for each kind of itinerary item
+itinerary_tables = {
+    "hotel": ("hotels", "checkin_date", "checkout_date"),
+    "car_rental": ("car_rentals", "start_date", "end_date"),
+    "excursion": ("trip_recommendations", None, None),
+}
+itinerary_labels = {
+    "hotel": "Hotel",
+    "car_rental": "Car rental",
+    "excursion": "Trip recommendation",
+}
+
+
+def _itinerary_lookup_sql(table: str, count: int) -> str:
+    return f"SELECT id FROM {table} WHERE id IN ({', '.join('?' * count)})"
+
+
+def _itinerary_booking_sql(table: str, start_column: Optional[str], end_column: Optional[str]) -> str:
+    if not start_column:
+        return f"UPDATE {table} SET booked = 1 WHERE id = ?"
+    # Dates left out of an item keep their current value
+    return (
+        f"UPDATE {table} SET booked = 1,"
+        f" {start_column} = COALESCE(?, {start_column}),"
+        f" {end_column} = COALESCE(?, {end_column})"
+        " WHERE id = ?"
+    )
+
+
+for _table, _start_column, _end_column in itinerary_tables.values():
+    tool_query(_itinerary_lookup_sql(_table, 2), (0, 0))
+    tool_query(
+        _itinerary_booking_sql(_table, _start_column, _end_column),
+        ("", "", 0) if _start_column else (0,),
+    )
+
+
+class ItineraryItem(BaseModel):
+    kind: Literal["hotel", "car_rental", "excursion"] = Field(
+        description="What to book."
+    )
+    id: int = Field(
+        description="The hotel, car rental or trip recommendation ID."
+    )
+    start_date: Optional[Union[datetime, date]] = Field(
+        default=None,
+        description="Check-in date for hotels, start date for car rentals. Keeps the current date when omitted.",
+    )
+    end_date: Optional[Union[datetime, date]] = Field(
+        default=None,
+        description="Check-out date for hotels, end date for car rentals. Keeps the current date when omitted.",
+    )
+
+
+@tool
+def book_itinerary(items: list[ItineraryItem]) -> list[dict]:
+    """
+    Book several hotels, car rentals and excursions at once, all or nothing.
+
+    Args:
+        items (list[ItineraryItem]): The items to book. Excursions take no dates.
+
+    Returns:
+        list[dict]: The status of each item, in the order given. If any item cannot be booked, nothing is booked.
+    """
+    items = [ItineraryItem.model_validate(item) for item in items]
+    by_kind = defaultdict(list)
+    for item in items:
+        by_kind[item.kind].append(item)
+
+    tables = [itinerary_tables[kind][0] for kind in by_kind]
+    with pool.write(*tables) as cursor:
+        found = {}
+        for kind, kind_items in by_kind.items():
+            table = itinerary_tables[kind][0]
+            ids = [item.id for item in kind_items]
+            cursor.execute(_itinerary_lookup_sql(table, len(ids)), ids)
+            found[kind] = {row[0] for row in cursor.fetchall()}
+        missing = [item for item in items if item.id not in found[item.kind]]
+
+        if not missing:
+            for kind, kind_items in by_kind.items():
+                table, start_column, end_column = itinerary_tables[kind]
+                query = _itinerary_booking_sql(table, start_column, end_column)
+                if start_column:
+                    cursor.executemany(
+                        query, [(item.start_date, item.end_date, item.id) for item in kind_items]
+                    )
+                else:
+                    cursor.executemany(query, [(item.id,) for item in kind_items])
+
+    results = []
+    for item in items:
+        label = itinerary_labels[item.kind]
+        if not missing:
+            status = f"{label} {item.id} successfully booked."
+        elif item in missing:
+            status = f"No {label.lower()} found with ID {item.id}."
+        else:
+            status = f"{label} {item.id} not booked, because another item could not be booked."
+        results.append({"kind": item.kind, "id": item.id, "status": status})
+    return results
+
+
+abook_itinerary = with_async(book_itinerary)
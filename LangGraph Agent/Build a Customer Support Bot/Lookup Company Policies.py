@@ -1,51 +1,496 @@
+import hashlib
+import json
+import os
 import re
+import threading
+import time
+from collections import OrderedDict
 
 import numpy as np
 import openai
+import requests
 from langchain_core.tools import tool
 
-response = requests.get(
-    "https://storage.googleapis.com/benchmarks-artifacts/travel-db/swiss_faq.md"
-)
-response.raise_for_status()
-faq_text = response.text
+faq_url = "https://storage.googleapis.com/benchmarks-artifacts/travel-db/swiss_faq.md"
+# Either a local copy of the FAQ (downloaded from faq_url on first use) or a
+# directory of policy markdown files
+policy_source = os.environ.get("POLICY_SOURCE", "swiss_faq.md")
 
-docs = [{"page_content": txt} for txt in re.split(r"(?=\n##)", faq_text)]
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _write_atomic(path: str, content: str):
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(f"{path}.tmp", path)
+
+
+def fetch_policy_text(path: str, url: str = faq_url, refresh: bool = False) -> str:
+    """Return the policy text cached at ``path``, downloading it if needed.
+
+    The ETag and content hash are kept in ``<path>.json``. An existing cache
+    whose hash still matches is used without touching the network, unless
+    ``refresh`` is set, in which case the server is asked whether it changed.
+    A local copy without ``<path>.json``, or one edited since the sidecar was
+    written, is treated as placed there by hand: it is used as is and gets a
+    fresh sidecar.
+    """
+    meta_path = f"{path}.json"
+    text, meta = None, {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        if meta.get("sha256") != _sha256(text):
+            # The ETag describes a different text, so don't send it
+            meta = {}
+            if not refresh:
+                _write_atomic(meta_path, json.dumps({"sha256": _sha256(text)}))
+    if text is not None and not refresh:
+        return text
+
+    headers = {"If-None-Match": meta["etag"]} if meta.get("etag") else {}
+    try:
+        response = requests.get(url, headers=headers, timeout=30)
+        response.raise_for_status()
+    except requests.RequestException:
+        if text is not None:
+            # Offline: a stale copy beats no policies at all
+            return text
+        raise
+    if response.status_code == 304:
+        return text
+
+    text = response.text
+    meta = {"url": url, "etag": response.headers.get("ETag"), "sha256": _sha256(text)}
+    _write_atomic(path, text)
+    _write_atomic(meta_path, json.dumps(meta))
+    return text
+
+
+def load_policy_docs(source: str = policy_source) -> list[dict]:
+    """Split the policy markdown into one document per ``##`` section."""
+    if os.path.isdir(source):
+        texts = {}
+        for name in sorted(os.listdir(source)):
+            if name.endswith(".md"):
+                with open(os.path.join(source, name), encoding="utf-8") as f:
+                    texts[name] = f.read()
+    else:
+        texts = {os.path.basename(source): fetch_policy_text(source)}
+    return [
+        {"page_content": txt, "source": name}
+        for name, text in texts.items()
+        for txt in re.split(r"(?=\n##)", text)
+    ]
+
+
+class OpenAIEmbedder:
+    def __init__(self, client, model: str = "text-embedding-3-small"):
+        self.client = client
+        self.model = model
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        embeddings = self.client.embeddings.create(model=self.model, input=texts)
+        return [emb.embedding for emb in embeddings.data]
+
+
+class HashingEmbedder:
+    """Deterministic local embedder based on feature-hashed word counts.
+
+    Needs no network access or API key, so it can stand in for the OpenAI
+    embedder in tests.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.model = f"hashing-{dim}"
+        self.dim = dim
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                digest = hashlib.md5(word.encode()).digest()
+                column = int.from_bytes(digest[:4], "little") % self.dim
+                vectors[row, column] += 1.0 if digest[4] & 1 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.where(norms == 0, 1, norms)).tolist()
+
+
+class EmbeddingCache:
+    """Embeddings persisted on disk and keyed by a hash of the embedded text.
+
+    Vectors live in ``<path>.npy`` and are memory-mapped on load; the sidecar
+    ``<path>.json`` records the embedding model and the content hash of every
+    row. Only texts that are not in the cache yet get sent to the embedder.
+    """
+
+    def __init__(self, path: str = "policy_embeddings"):
+        self._vectors_path = f"{path}.npy"
+        self._index_path = f"{path}.json"
+        self._model = None
+        self._keys = []
+        self._rows = {}
+        self._vectors = None
+        if os.path.exists(self._index_path) and os.path.exists(self._vectors_path):
+            with open(self._index_path) as f:
+                index = json.load(f)
+            self._model = index["model"]
+            self._keys = index["keys"]
+            self._rows = {key: row for row, key in enumerate(self._keys)}
+            self._vectors = np.load(self._vectors_path, mmap_mode="r")
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def embed(self, texts: list[str], embedder) -> np.ndarray:
+        if self._model != embedder.model:
+            # Vectors from another model are not comparable, start over
+            self._model = embedder.model
+            self._keys = []
+            self._rows = {}
+            self._vectors = None
+        keys = [self._key(text) for text in texts]
+        missing = {key: text for key, text in zip(keys, texts) if key not in self._rows}
+        if missing:
+            vectors = embedder.embed(list(missing.values()))
+            self._append(list(missing), np.asarray(vectors, dtype=np.float32))
+        return np.asarray(self._vectors[[self._rows[key] for key in keys]])
+
+    def _append(self, keys: list[str], vectors: np.ndarray):
+        if self._vectors is not None:
+            vectors = np.concatenate([np.array(self._vectors), vectors])
+        self._vectors = None
+        self._keys = self._keys + keys
+        self._rows = {key: row for row, key in enumerate(self._keys)}
+
+        # Write to temp files and rename so a crash never leaves a torn cache
+        with open(f"{self._vectors_path}.tmp", "wb") as f:
+            np.save(f, vectors)
+        with open(f"{self._index_path}.tmp", "w") as f:
+            json.dump({"model": self._model, "keys": self._keys}, f)
+        os.replace(f"{self._vectors_path}.tmp", self._vectors_path)
+        os.replace(f"{self._index_path}.tmp", self._index_path)
+        self._vectors = np.load(self._vectors_path, mmap_mode="r")
+
+
+class QueryCache:
+    """Bounded LRU with a TTL for query embeddings and their top-k results.
+
+    Entries are keyed on normalized query text. With ``similarity_threshold``
+    set, a query that misses on text but whose embedding is at least that
+    cosine-similar to a cached query reuses the cached results. ``stats``
+    counts exact-text hits and misses, and how many of those misses the
+    similarity tier answered.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        ttl: float = 3600.0,
+        similarity_threshold: float | None = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(re.findall(r"\w+", query.lower()))
+
+    def _get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires"] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def lookup(self, query: str, k: int):
+        """Return ``(results, embedding)``; either may be None on a miss."""
+        with self._lock:
+            entry = self._get(self.normalize(query))
+            results = entry["results"].get(k) if entry else None
+            self.stats["hits" if results is not None else "misses"] += 1
+            return results, entry["embedding"] if entry else None
+
+    def lookup_similar(self, embedding: np.ndarray, k: int):
+        """Return cached results of the most similar query above the threshold."""
+        if self.similarity_threshold is None:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            candidates = [
+                entry
+                for entry in self._entries.values()
+                if entry["expires"] >= now and k in entry["results"]
+            ]
+            if not candidates:
+                return None
+            matrix = np.stack([entry["embedding"] for entry in candidates])
+            norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(embedding)
+            scores = (matrix @ embedding) / np.maximum(norms, 1e-12)
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity_threshold:
+                return None
+            self.stats["semantic_hits"] += 1
+            return candidates[best]["results"][k]
+
+    def store(self, query: str, k: int, embedding: np.ndarray, results: list[dict]):
+        key = self.normalize(query)
+        with self._lock:
+            entry = self._get(key)
+            if entry is None:
+                entry = {"embedding": embedding, "results": {}}
+                self._entries[key] = entry
+            entry["results"][k] = results
+            entry["expires"] = time.monotonic() + self.ttl
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _scores(queries: np.ndarray, vectors: np.ndarray, chunk_size: int = 65536):
+    """Return ``queries @ vectors.T`` as float32.
+
+    NumPy has no BLAS kernel for float16, so a half-precision matrix is
+    converted to float32 one chunk of rows at a time before multiplying.
+    """
+    queries = queries.astype(np.float32, copy=False)
+    if vectors.dtype == np.float32:
+        return queries @ vectors.T
+    scores = np.empty((len(queries), len(vectors)), dtype=np.float32)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = vectors[start : start + chunk_size].astype(np.float32)
+        scores[:, start : start + chunk_size] = queries @ chunk.T
+    return scores
+
+
+class IVFIndex:
+    """Inverted-file approximate nearest-neighbour index in plain NumPy.
+
+    The corpus is clustered with spherical k-means into ``nlist`` lists; a
+    query is only scored against the vectors in its ``nprobe`` closest lists.
+    The index keeps a reference to ``vectors`` rather than a copy, so vectors
+    are expected to be L2-normalized already.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        nlist: int | None = None,
+        nprobe: int = 8,
+        iterations: int = 10,
+        chunk_size: int = 65536,
+        seed: int = 0,
+    ):
+        self._vectors = vectors
+        self.nlist = nlist or max(1, int(np.sqrt(len(vectors))))
+        self.nprobe = nprobe
+        self._chunk_size = chunk_size
+
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(len(vectors), size=self.nlist, replace=False)
+        self._centroids = np.array(vectors[sample], dtype=np.float32)
+        for _ in range(iterations):
+            assignment = self._assign(vectors)
+            sums = np.zeros_like(self._centroids)
+            for start in range(0, len(vectors), chunk_size):
+                chunk = vectors[start : start + chunk_size].astype(np.float32)
+                np.add.at(sums, assignment[start : start + chunk_size], chunk)
+            filled = np.bincount(assignment, minlength=self.nlist) > 0
+            # Empty lists keep their previous centroid
+            self._centroids[filled] = _normalize(sums[filled])
+
+        assignment = self._assign(vectors)
+        self._order = np.argsort(assignment, kind="stable")
+        self._offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assignment, minlength=self.nlist))]
+        )
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.concatenate(
+            [
+                np.argmax(
+                    vectors[start : start + self._chunk_size].astype(np.float32)
+                    @ self._centroids.T,
+                    axis=1,
+                )
+                for start in range(0, len(vectors), self._chunk_size)
+            ]
+        )
+
+    def search(self, queries: np.ndarray, k: int):
+        """Return ``(ids, scores)`` per query, best match first."""
+        probes = np.argsort(-(queries @ self._centroids.T), axis=1)[:, : self.nprobe]
+        results = []
+        for query, lists in zip(queries, probes):
+            candidates = np.concatenate(
+                [self._order[self._offsets[i] : self._offsets[i + 1]] for i in lists]
+            )
+            scores = _scores(
+                query[np.newaxis], self._vectors[candidates], self._chunk_size
+            )[0]
+            top = np.argsort(-scores)[:k]
+            results.append((candidates[top], scores[top]))
+        return results
 
 
 class VectorStoreRetriever:
-    def __init__(self, docs: list, vectors: list, oai_client):
-        self._arr = np.array(vectors)
+    def __init__(
+        self,
+        docs: list,
+        vectors: list,
+        embedder,
+        query_cache=None,
+        dtype=np.float32,
+        ann_threshold: int = 20000,
+        index=None,
+    ):
+        # Normalize once up front so that a query is a single dot product per
+        # document, and keep the matrix contiguous so BLAS can use it directly.
+        # Pass dtype=np.float16 to halve the memory of a large corpus; scores
+        # are still computed in float32.
+        self._arr = np.ascontiguousarray(
+            _normalize(np.asarray(vectors, dtype=np.float32)), dtype=dtype
+        )
         self._docs = docs
-        self._client = oai_client
+        # Accept a bare OpenAI client for backwards compatibility
+        if not hasattr(embedder, "embed"):
+            embedder = OpenAIEmbedder(embedder)
+        self._embedder = embedder
+        self.query_cache = query_cache
+        # Any object with a search(queries, k) method like IVFIndex can be used
+        if index is None and len(docs) >= ann_threshold:
+            index = IVFIndex(self._arr)
+        self.index = index
 
     @classmethod
-    def from_docs(cls, docs, oai_client):
-        embeddings = oai_client.embeddings.create(
-            model="text-embedding-3-small", input=[doc["page_content"] for doc in docs]
-        )
-        vectors = [emb.embedding for emb in embeddings.data]
-        return cls(docs, vectors, oai_client)
+    def from_docs(
+        cls,
+        docs,
+        oai_client=None,
+        embedder=None,
+        cache=None,
+        query_cache=None,
+        **kwargs,
+    ):
+        embedder = embedder or OpenAIEmbedder(oai_client)
+        texts = [doc["page_content"] for doc in docs]
+        if cache is not None:
+            vectors = cache.embed(texts, embedder)
+        else:
+            vectors = embedder.embed(texts)
+        return cls(docs, vectors, embedder, query_cache, **kwargs)
 
     def query(self, query: str, k: int = 5) -> list[dict]:
-        embed = self._client.embeddings.create(
-            model="text-embedding-3-small", input=[query]
-        )
-        # "@" is just a matrix multiplication in python
-        scores = np.array(embed.data[0].embedding) @ self._arr.T
-        top_k_idx = np.argpartition(scores, -k)[-k:]
-        top_k_idx_sorted = top_k_idx[np.argsort(-scores[top_k_idx])]
+        cache = self.query_cache
+        embed = None
+        if cache is not None:
+            results, embed = cache.lookup(query, k)
+            if results is not None:
+                return results
+        if embed is None:
+            embed = np.array(self._embedder.embed([query])[0])
+            if cache is not None:
+                results = cache.lookup_similar(embed, k)
+                if results is not None:
+                    cache.store(query, k, embed, results)
+                    return results
+        results = self._top_k(embed[np.newaxis], k)[0]
+        if cache is not None:
+            cache.store(query, k, embed, results)
+        return results
+
+    def query_batch(self, queries: list[str], k: int = 5) -> list[list[dict]]:
+        """Run ``query`` for many queries at once.
+
+        Queries that are not answered by the query cache are embedded in a
+        single request and scored with one matrix-matrix product.
+        """
+        cache = self.query_cache
+        results = [None] * len(queries)
+        embeds = [None] * len(queries)
+        if cache is not None:
+            for i, query in enumerate(queries):
+                results[i], embeds[i] = cache.lookup(query, k)
+        to_embed = [i for i, embed in enumerate(embeds) if embed is None]
+        if to_embed:
+            vectors = self._embedder.embed([queries[i] for i in to_embed])
+            for i, vector in zip(to_embed, vectors):
+                embeds[i] = np.array(vector)
+        pending = [i for i, result in enumerate(results) if result is None]
+        if pending:
+            matrix = np.stack([embeds[i] for i in pending])
+            for i, result in zip(pending, self._top_k(matrix, k)):
+                results[i] = result
+                if cache is not None:
+                    cache.store(queries[i], k, embeds[i], result)
+        return results
+
+    def _top_k(self, embeds: np.ndarray, k: int) -> list[list[dict]]:
+        embeds = _normalize(np.asarray(embeds, dtype=np.float32))
+        if self.index is not None:
+            hits = self.index.search(embeds, k)
+        else:
+            hits = self._exact_search(embeds, k)
         return [
-            {**self._docs[idx], "similarity": scores[idx]} for idx in top_k_idx_sorted
+            [
+                {**self._docs[idx], "similarity": score}
+                for idx, score in zip(ids, scores)
+            ]
+            for ids, scores in hits
         ]
 
+    def _exact_search(self, embeds: np.ndarray, k: int):
+        # "@" is just a matrix multiplication in python
+        scores = _scores(embeds, self._arr)
+        k = min(k, scores.shape[1])
+        # Per-row top-k without a Python loop: partition, then sort only k columns
+        top_k_idx = np.argpartition(scores, -k, axis=1)[:, -k:]
+        top_k_scores = np.take_along_axis(scores, top_k_idx, axis=1)
+        order = np.argsort(-top_k_scores, axis=1)
+        return zip(
+            np.take_along_axis(top_k_idx, order, axis=1),
+            np.take_along_axis(top_k_scores, order, axis=1),
+        )
+
+
+# Built on the first lookup_policy call so importing this module stays cheap
+retriever = None
+_retriever_lock = threading.Lock()
+
 
-retriever = VectorStoreRetriever.from_docs(docs, openai.Client())
+def get_retriever() -> VectorStoreRetriever:
+    global retriever
+    with _retriever_lock:
+        if retriever is None:
+            retriever = VectorStoreRetriever.from_docs(
+                load_policy_docs(),
+                openai.Client(),
+                cache=EmbeddingCache(),
+                query_cache=QueryCache(),
+            )
+    return retriever
 
 
 @tool
 def lookup_policy(query: str) -> str:
     """Consult the company policies to check whether certain options are permitted.
     Use this before making any flight changes performing other 'write' events."""
-    docs = retriever.query(query, k=2)
-    return "\n\n".join([doc["page_content"] for doc in docs])
\ No newline at end of file
+    docs = get_retriever().query(query, k=2)
+    return "\n\n".join([doc["page_content"] for doc in docs])
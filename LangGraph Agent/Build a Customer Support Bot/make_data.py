@@ -1,6 +1,6 @@
 import os
-import shutil
 import sqlite3
+from datetime import datetime, timezone
 
 import pandas as pd
 import requests
@@ -10,58 +10,224 @@ local_file = "travel2.sqlite"
 # The backup lets us restart for each tutorial section
 backup_file = "travel2.backup.sqlite"
 overwrite = False
+
+
+def copy_db(source, target):
+    """Copy one SQLite database over another with the online backup API.
+
+    Unlike a file copy this is safe while other connections have ``target``
+    open; they simply see the new contents on their next read.
+    """
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    src.backup(dst)
+    dst.close()
+    src.close()
+
+
 if overwrite or not os.path.exists(local_file):
     response = requests.get(db_url)
     response.raise_for_status()  # Ensure the request was successful
     with open(local_file, "wb") as f:
         f.write(response.content)
     # Backup - we will use this to "reset" our DB in each section
-    shutil.copy(local_file, backup_file)
+    copy_db(local_file, backup_file)
+
+
+# Indexes matching the access paths of the tools. ``to_sql(if_exists="replace")``
+# drops a table's indexes along with it, so these are recreated after every rewrite.
+indexes = {
+    "idx_flights_route_departure": "flights (departure_airport, arrival_airport, scheduled_departure)",
+    "idx_flights_arrival_departure": "flights (arrival_airport, scheduled_departure)",
+    "idx_flights_departure": "flights (scheduled_departure)",
+    "idx_flights_flight_id": "flights (flight_id)",
+    "idx_tickets_passenger": "tickets (passenger_id, ticket_no)",
+    "idx_tickets_ticket_no": "tickets (ticket_no)",
+    "idx_ticket_flights_ticket": "ticket_flights (ticket_no, flight_id)",
+    "idx_ticket_flights_flight": "ticket_flights (flight_id)",
+    "idx_boarding_passes_ticket_flight": "boarding_passes (ticket_no, flight_id)",
+    "idx_hotels_id": "hotels (id)",
+    "idx_car_rentals_id": "car_rentals (id)",
+    "idx_trip_recommendations_id": "trip_recommendations (id)",
+}
+
+
+def create_indexes(conn):
+    for name, columns in indexes.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {columns}")
+    conn.execute("ANALYZE")
+
+
+# FTS5 indexes behind the hotel, car rental and excursion searches. They are
+# external-content tables, so the text lives only in the base table and the
+# triggers below keep the index in sync with every write.
+search_indexes = {
+    "hotels": ("name", "location"),
+    "car_rentals": ("name", "location"),
+    "trip_recommendations": ("name", "location", "keywords"),
+}
+
+
+def create_search_indexes(conn):
+    for table, columns in search_indexes.items():
+        fts = f"{table}_fts"
+        cols = ", ".join(columns)
+        new = ", ".join(f"new.{column}" for column in columns)
+        old = ", ".join(f"old.{column}" for column in columns)
+        conn.executescript(
+            f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {cols}, content='{table}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            );
+            CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new});
+            END;
+            CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});
+            END;
+            CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF id, {cols} ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});
+                INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new});
+            END;
+            """
+        )
+        # The base table may have been replaced wholesale, so resync the index
+        conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+datetime_columns = [
+    "scheduled_departure",
+    "scheduled_arrival",
+    "actual_departure",
+    "actual_arrival",
+]
+
+
+def _parse_timestamp(value):
+    if value is None or value == "\\N":
+        return None
+    return datetime.fromisoformat(value)
+
+
+def rebase_dates(conn):
+    """Shift flights and bookings so the latest actual departure is "now".
+
+    Produces the same values as the pandas path in ``update_dates``, but finds
+    the offset with one aggregate query and rewrites only the datetime columns
+    in place, so the large untouched tables are never read.
+    """
+
+    def epoch(value):
+        timestamp = _parse_timestamp(value)
+        return timestamp.timestamp() if timestamp else None
+
+    conn.create_function("epoch", 1, epoch, deterministic=True)
+    # A bare column next to MAX() takes its value from the row holding the max
+    (latest, _) = conn.execute(
+        "SELECT actual_departure, MAX(epoch(actual_departure)) FROM flights"
+    ).fetchone()
+    example_time = _parse_timestamp(latest)
+    time_diff = datetime.now() - example_time.replace(tzinfo=None)
+
+    def shift(value):
+        timestamp = _parse_timestamp(value)
+        return (timestamp + time_diff).isoformat(" ") if timestamp else None
+
+    def shift_utc(value):
+        timestamp = _parse_timestamp(value)
+        if not timestamp:
+            return None
+        return (timestamp.astimezone(timezone.utc) + time_diff).isoformat(" ")
+
+    conn.create_function("shift", 1, shift, deterministic=True)
+    conn.create_function("shift_utc", 1, shift_utc, deterministic=True)
+    assignments = ", ".join(
+        f"{column} = shift({column})" for column in datetime_columns
+    )
+    with conn:
+        conn.execute("UPDATE bookings SET book_date = shift_utc(book_date)")
+        conn.execute(f"UPDATE flights SET {assignments}")
+
+
+def _invalidate_pool():
+    # Rewriting the file bypasses the tools' connection pool, so drop what it
+    # has cached. ``pool`` only exists once Database.py has run.
+    if "pool" in globals():
+        pool.invalidate()
 
 
 # Convert the flights to present time for our tutorial
-def update_dates(file):
-    shutil.copy(backup_file, file)
+def update_dates(file, in_place=True):
+    copy_db(backup_file, file)
     conn = sqlite3.connect(file)
-    cursor = conn.cursor()
-
-    tables = pd.read_sql(
-        "SELECT name FROM sqlite_master WHERE type='table';", conn
-    ).name.tolist()
-    tdf = {}
-    for t in tables:
-        tdf[t] = pd.read_sql(f"SELECT * from {t}", conn)
-
-    example_time = pd.to_datetime(
-        tdf["flights"]["actual_departure"].replace("\\N", pd.NaT)
-    ).max()
-    current_time = pd.to_datetime("now").tz_localize(example_time.tz)
-    time_diff = current_time - example_time
-
-    tdf["bookings"]["book_date"] = (
-        pd.to_datetime(tdf["bookings"]["book_date"].replace("\\N", pd.NaT), utc=True)
-        + time_diff
-    )
 
-    datetime_columns = [
-        "scheduled_departure",
-        "scheduled_arrival",
-        "actual_departure",
-        "actual_arrival",
-    ]
-    for column in datetime_columns:
-        tdf["flights"][column] = (
-            pd.to_datetime(tdf["flights"][column].replace("\\N", pd.NaT)) + time_diff
+    if in_place:
+        rebase_dates(conn)
+    else:
+        tables = pd.read_sql(
+            "SELECT name FROM sqlite_master WHERE type='table';", conn
+        ).name.tolist()
+        tdf = {}
+        for t in tables:
+            tdf[t] = pd.read_sql(f"SELECT * from {t}", conn)
+
+        example_time = pd.to_datetime(
+            tdf["flights"]["actual_departure"].replace("\\N", pd.NaT)
+        ).max()
+        current_time = pd.to_datetime("now").tz_localize(example_time.tz)
+        time_diff = current_time - example_time
+
+        tdf["bookings"]["book_date"] = (
+            pd.to_datetime(
+                tdf["bookings"]["book_date"].replace("\\N", pd.NaT), utc=True
+            )
+            + time_diff
         )
 
-    for table_name, df in tdf.items():
-        df.to_sql(table_name, conn, if_exists="replace", index=False)
-    del df
-    del tdf
+        for column in datetime_columns:
+            tdf["flights"][column] = (
+                pd.to_datetime(tdf["flights"][column].replace("\\N", pd.NaT))
+                + time_diff
+            )
+
+        for table_name, df in tdf.items():
+            df.to_sql(table_name, conn, if_exists="replace", index=False)
+        del df
+        del tdf
+
+    create_indexes(conn)
+    create_search_indexes(conn)
     conn.commit()
     conn.close()
+    _invalidate_pool()
+
+    return file
+
+
+# Pristine, already rebased copy of the database held in memory, so that a reset
+# between runs is a page-level restore instead of a copy plus a full rebase.
+# Dates stay relative to when the snapshot was taken; call update_dates again
+# to rebase to the current time.
+snapshot = None
 
+
+def take_snapshot(file):
+    global snapshot
+    src = sqlite3.connect(file)
+    snapshot = sqlite3.connect(":memory:", check_same_thread=False)
+    src.backup(snapshot)
+    src.close()
+
+
+def reset_db(file):
+    """Restore ``file`` to the state captured by ``take_snapshot``."""
+    conn = sqlite3.connect(file)
+    snapshot.backup(conn)
+    conn.close()
+    _invalidate_pool()
     return file
 
 
-db = update_dates(local_file)
\ No newline at end of file
+db = update_dates(local_file)
+take_snapshot(db)
\ No newline at end of file
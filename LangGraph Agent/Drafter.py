@@ -1,4 +1,8 @@
-from typing import Annotated, Sequence, TypedDict
+import hashlib
+import json
+import os
+import threading
+from typing import Annotated, Optional, Sequence, TypedDict
 from dotenv import load_dotenv  
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage, SystemMessage
 from langchain_groq import ChatGroq
@@ -6,58 +10,271 @@ from langchain_core.tools import tool
 from langgraph.graph.message import add_messages
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
+from history import HistoryCompactor
+from piece_table import PieceTable
+from checkpointer import get_checkpointer, thread_config
 
 load_dotenv()
 
-document_content = ""
+# The document being edited. The edits that produced it are also kept in the
+# checkpointed graph state, so a resumed conversation gets its document back
+# (see ``restore``)
+document = PieceTable()
+# Identifies the edits applied to ``document``; matches the state's
+# ``document_id`` when the in-memory document is that conversation's
+document_id = ""
+# Edits made by tools since the last ``run_tools`` collected them
+new_edits = []
+# Line of the most recent edit; prompts show the document around it
+last_edit_line = 1
+# Bumped on every edit; the version on disk is recorded per file, so saving
+# unchanged content again is skipped
+document_version = 0
+saved_versions = {}
+# Set by save(autosave=True); the document is then written after every change
+autosave_path = None
+# The file this conversation last saved to
+save_path = None
+# Successful final saves, which end the session
+final_saves = 0
+# Held by every tool that reads or changes the document
+document_lock = threading.RLock()
+
+def add_edits(left: list, right: list) -> list:
+    """Append a turn's edits; a whole-document 'update' drops the ones before it."""
+    for i in range(len(right) - 1, -1, -1):
+        if right[i][0] == "update":
+            return list(right[i:])
+    return list(left or []) + list(right)
 
 class AgentState(TypedDict):
     messages: Annotated[Sequence[BaseMessage], add_messages]
+    # True while the latest edits are not on disk
+    dirty: bool
+    # True once the document has been saved and the session should finish
+    saved: bool
+    # The edits that build the document, the ID of their result, where prompts
+    # centre their view, and the autosave file
+    document_edits: Annotated[list, add_edits]
+    document_id: str
+    last_edit_line: int
+    autosave_path: Optional[str]
+
+def apply_edit(edit: list):
+    """Apply ["update", text] or ["replace", offset, length, text] to the document."""
+    global document, document_id
+    if edit[0] == "update":
+        document = PieceTable(edit[1])
+    else:
+        _, offset, length, text = edit
+        document.replace(offset, length, text)
+    document_id = hashlib.sha256(json.dumps([document_id, edit]).encode()).hexdigest()[:16]
+
+def record_edit(edit: list):
+    apply_edit(edit)
+    new_edits.append(edit)
+
+def restore(state: AgentState):
+    """Load the conversation's document, e.g. after resuming it on a fresh worker.
+
+    The document is only rebuilt when it is not already the state's one.
+    """
+    global document, document_id, last_edit_line, document_version, autosave_path
+    if state.get("document_id", "") != document_id:
+        document, document_id = PieceTable(), ""
+        for edit in state.get("document_edits") or []:
+            apply_edit(edit)
+        document_version += 1
+    last_edit_line = state.get("last_edit_line", 1)
+    autosave_path = state.get("autosave_path")
+
+def numbered(first: int, last: int) -> str:
+    return "\n".join(f"{n:>5}| {line}" for n, line in enumerate(document.lines(first, last), first))
+
+def outline(max_entries: int = 40) -> str:
+    """Headings and paragraph openings with their line numbers."""
+    entries = []
+    previous = ""
+    for n, line in enumerate(document.iter_lines(), 1):
+        if line.strip() and (line.startswith("#") or not previous.strip()):
+            entries.append(f"{n:>5}| {line[:60]}")
+            if len(entries) == max_entries:
+                entries.append("  ...")
+                break
+        previous = line
+    return "\n".join(entries)
+
+def document_view(context_lines: int = 20) -> str:
+    """What the model sees of the document: all of it if short, else an outline plus a window."""
+    line_count = document.line_count()
+    if line_count <= 2 * context_lines + 1:
+        return numbered(1, line_count)
+    first = max(1, last_edit_line - context_lines)
+    last = min(line_count, last_edit_line + context_lines)
+    return (
+        f"The document has {line_count} lines. Outline:\n{outline()}\n\n"
+        f"Lines {first}-{last}, around the last edit:\n{numbered(first, last)}"
+    )
+
+def locate(anchor: Optional[str], start_line: Optional[int], end_line: Optional[int]) -> tuple[int, int]:
+    """Character range of an exact anchor or of an inclusive line range."""
+    if anchor:
+        offset = document.find(anchor)
+        if offset < 0:
+            raise ValueError(f"Anchor {anchor!r} was not found in the document.")
+        if document.find(anchor, offset + 1) >= 0:
+            raise ValueError(f"Anchor {anchor!r} appears more than once; quote more of the text or use line numbers.")
+        return offset, offset + len(anchor)
+    if start_line:
+        end_line = end_line or start_line
+        if not 1 <= start_line <= end_line <= document.line_count():
+            raise ValueError(f"Lines {start_line}-{end_line} are outside the document (1-{document.line_count()}).")
+        return document.line_offset(start_line), document.line_offset(end_line + 1)
+    raise ValueError("Give either an anchor or a line range.")
+
+def edited(offset: int, length: int) -> str:
+    """Remember where the document changed and show the changed lines."""
+    global last_edit_line, document_version
+    last_edit_line = document.line_at(offset)
+    document_version += 1
+    last = min(document.line_count(), document.line_at(offset + length) + 1)
+    return f"Document has been updated successfully! It now reads:\n{numbered(max(1, last_edit_line - 1), last)}"
 
 @tool
 def update(content: str) -> str:
-    """Updates the document with the provided content."""
-    global document_content
-    document_content = content
-    return f"Document has been updated successfully! The current content is:\n{document_content}"
+    """Replaces the whole document. Only use this to write a new document; use insert_text, replace_text or delete_text to change an existing one."""
+    global last_edit_line, document_version
+    with document_lock:
+        record_edit(["update", content])
+        last_edit_line = 1
+        document_version += 1
+        return f"Document has been updated successfully! It now has {document.line_count()} lines."
+
+@tool
+def insert_text(text: str, after: Optional[str] = None, line: Optional[int] = None) -> str:
+    """Inserts text into the document.
+
+    Args:
+        text: The text to insert, including any line breaks it needs.
+        after: Exact text from the document to insert directly after.
+        line: Line number to insert before. Without `after` or `line`, the text is appended.
+    """
+    with document_lock:
+        try:
+            if after:
+                offset = locate(after, None, None)[1]
+            elif line:
+                offset = document.line_offset(line)
+            else:
+                offset = len(document)
+        except ValueError as e:
+            return f"Error: {e}"
+        record_edit(["replace", offset, 0, text])
+        return edited(offset, len(text))
+
+@tool
+def replace_text(text: str, anchor: Optional[str] = None, start_line: Optional[int] = None, end_line: Optional[int] = None) -> str:
+    """Replaces part of the document.
+
+    Args:
+        text: The replacement text.
+        anchor: Exact text from the document to replace.
+        start_line: First line to replace, when not using `anchor`.
+        end_line: Last line to replace, inclusive. Defaults to `start_line`.
+    """
+    with document_lock:
+        try:
+            start, end = locate(anchor, start_line, end_line)
+        except ValueError as e:
+            return f"Error: {e}"
+        if not anchor and end > start and document.slice(end - 1, end) == "\n" and not text.endswith("\n"):
+            # A line range includes its final line break; keep the following line separate
+            text += "\n"
+        record_edit(["replace", start, end - start, text])
+        return edited(start, len(text))
+
+@tool
+def delete_text(anchor: Optional[str] = None, start_line: Optional[int] = None, end_line: Optional[int] = None) -> str:
+    """Deletes part of the document.
+
+    Args:
+        anchor: Exact text from the document to delete.
+        start_line: First line to delete, when not using `anchor`.
+        end_line: Last line to delete, inclusive. Defaults to `start_line`.
+    """
+    with document_lock:
+        try:
+            start, end = locate(anchor, start_line, end_line)
+        except ValueError as e:
+            return f"Error: {e}"
+        record_edit(["replace", start, end - start, ""])
+        return edited(start, 0)
 
 
+def write_document(filename: str) -> bool:
+    """Write the document unless ``filename`` already holds this version.
+
+    The text is streamed to a temporary file that then replaces ``filename``,
+    so a crash mid-write never leaves a truncated document behind.
+    """
+    with document_lock:
+        if saved_versions.get(filename) == document_version and os.path.exists(filename):
+            return False
+        temp_filename = f"{filename}.tmp"
+        with open(temp_filename, 'w') as file:
+            for chunk in document.chunks():
+                file.write(chunk)
+        os.replace(temp_filename, filename)
+        saved_versions[filename] = document_version
+        return True
+
 @tool
-def save(filename: str) -> str:
+def save(filename: str, autosave: bool = False) -> str:
     """Save the current document to a text file and finish the process.
     
     Args:
         filename: Name for the text file.
+        autosave: Instead of finishing, keep saving to this file after every change.
     """
-
-    global document_content
+    global autosave_path, save_path, final_saves
 
     if not filename.endswith('.txt'):
         filename = f"{filename}.txt"
 
 
     try:
-        with open(filename, 'w') as file:
-            file.write(document_content)
-        print(f"\n💾 Document has been saved to: {filename}")
-        return f"Document has been saved successfully to '{filename}'."
-    
+        write_document(filename)
     except Exception as e:
         return f"Error saving document: {str(e)}"
+    save_path = filename
+
+    if autosave:
+        autosave_path = filename
+        print(f"\n💾 Autosaving the document to: {filename}")
+        return f"Autosave is on: the document is saved to '{filename}' after every change."
+    final_saves += 1
+    print(f"\n💾 Document has been saved to: {filename}")
+    return f"Document has been saved successfully to '{filename}'."
 
-tools = [update, save]
+tools = [update, insert_text, replace_text, delete_text, save]
 
-model = ChatGroq(model="meta-llama/llama-4-maverick-17b-128e-instruct").bind_tools(tools)
+llm = ChatGroq(model="meta-llama/llama-4-maverick-17b-128e-instruct")
+model = llm.bind_tools(tools)
+# Summarizes with the plain model, so summaries never trigger tool calls
+history = HistoryCompactor(llm)
 
 def our_agent(state: AgentState) -> AgentState:
+    restore(state)
     system_prompt = SystemMessage(content=f"""
     You are Drafter, a helpful writing assistant. You are going to help the user update and modify documents.
     
-    - If the user wants to update or modify content, use the 'update' tool with the complete updated content.
+    - To write a new document, use the 'update' tool with the complete content.
+    - To modify the document, use 'insert_text', 'replace_text' or 'delete_text' with exact text from the document as the anchor, or with line numbers from the view below. Never resend the whole document to change part of it.
     - If the user wants to save and finish, you need to use the 'save' tool.
-    - Make sure to always show the current document state after modifications.
+    - After modifications, briefly tell the user what changed.
     
-    The current document content is:{document_content}
+    The current document (line numbers are not part of the text):
+{document_view()}
     """)
     if not state["messages"]:
         user_input = "I'm ready to help you update a document. What would you like to create?"
@@ -68,7 +285,7 @@ def our_agent(state: AgentState) -> AgentState:
         print(f"\n👤 USER: {user_input}")
         user_message = HumanMessage(content=user_input)
 
-    all_messages = [system_prompt] + list(state["messages"]) + [user_message]
+    all_messages = [system_prompt] + history.compact(list(state["messages"]) + [user_message])
 
     response = model.invoke(all_messages)
 
@@ -76,26 +293,12 @@ def our_agent(state: AgentState) -> AgentState:
     if hasattr(response, "tool_calls") and response.tool_calls:
         print(f"🔧 USING TOOLS: {[tc['name'] for tc in response.tool_calls]}")
 
-    return {"messages": list(state["messages"]) + [user_message, response]}
+    return {"messages": [user_message, response]}
 
 
 def should_continue(state: AgentState) -> str:
     """Determine if we should continue or end the conversation."""
-
-    messages = state["messages"]
-    
-    if not messages:
-        return "continue"
-    
-    # This looks for the most recent tool message....
-    for message in reversed(messages):
-        # ... and checks if this is a ToolMessage resulting from save
-        if (isinstance(message, ToolMessage) and 
-            "saved" in message.content.lower() and
-            "document" in message.content.lower()):
-            return "end" # goes to the end edge which leads to the endpoint
-        
-    return "continue"
+    return "end" if state.get("saved") else "continue"
 
 def print_messages(messages):
     """Function I made to print the messages in a more readable format"""
@@ -107,10 +310,101 @@ def print_messages(messages):
             print(f"\n🛠️ TOOL RESULT: {message.content}")
 
 
+tool_node = ToolNode(tools)
+
+def line_range(tool_call: dict) -> Optional[tuple[int, int]]:
+    """Lines a line-number edit touches; an insert before line n is (n, n - 1)."""
+    args = tool_call["args"]
+    if tool_call["name"] == "insert_text" and not args.get("after") and args.get("line"):
+        return args["line"], args["line"] - 1
+    if tool_call["name"] in ("replace_text", "delete_text") and not args.get("anchor") and args.get("start_line"):
+        return args["start_line"], args.get("end_line") or args["start_line"]
+    return None
+
+def overlaps(a: tuple[int, int], b: tuple[int, int]) -> bool:
+    (first_a, last_a), (first_b, last_b) = a, b
+    if last_a < first_a and last_b < first_b:
+        return False
+    if last_a < first_a:
+        return first_b < first_a <= last_b
+    if last_b < first_b:
+        return first_a < first_b <= last_a
+    return first_a <= last_b and first_b <= last_a
+
+def edit_order(tool_calls: list[dict]) -> tuple[list[dict], dict]:
+    """Order a turn's tool calls so every line number still means what the model saw.
+
+    A rewrite with 'update' goes first. Line-number edits follow, bottom of the
+    document first, so none of them shifts the lines another one refers to.
+    Anchored edits and appends come next, and 'save' comes last. A line edit
+    that overlaps another one in the same turn is rejected. Returns the calls
+    to run and an error message per rejected call ID.
+    """
+    rank = {"update": 0, "save": 3}
+
+    def key(item):
+        index, tool_call = item
+        lines = line_range(tool_call)
+        if lines is None:
+            return rank.get(tool_call["name"], 2), 0, False, index
+        first, last = lines
+        # At the same line, replace before inserting so the insert lands above
+        # the new text; inserts run last to first so they keep their order
+        return 1, -first, last < first, -index
+
+    calls, rejected, taken = [], {}, []
+    for _, tool_call in sorted(enumerate(tool_calls), key=key):
+        lines = line_range(tool_call)
+        if lines and any(overlaps(lines, other) for other in taken):
+            rejected[tool_call["id"]] = (
+                "Error: this edit overlaps lines changed by another edit in the same turn. "
+                "Check the updated document and retry it."
+            )
+            continue
+        if lines:
+            taken.append(lines)
+        calls.append(tool_call)
+    return calls, rejected
+
+def run_tools(state: AgentState) -> AgentState:
+    """Run the requested tools, autosave if enabled, and report the document's state."""
+    restore(state)
+    saves = final_saves
+    new_edits.clear()
+    # One call at a time, in an order that keeps line numbers valid; ToolNode
+    # would run them concurrently
+    tool_calls = state["messages"][-1].tool_calls
+    calls, rejected = edit_order(tool_calls)
+    outcome = {
+        tool_call_id: ToolMessage(content=error, tool_call_id=tool_call_id)
+        for tool_call_id, error in rejected.items()
+    }
+    for tool_call in calls:
+        single = AIMessage(content="", tool_calls=[tool_call])
+        outcome[tool_call["id"]] = tool_node.invoke({"messages": [single]})["messages"][0]
+    if autosave_path:
+        try:
+            write_document(autosave_path)
+        except Exception as e:
+            print(f"\n⚠️ Autosave to {autosave_path} failed: {e}")
+    changes = {
+        "messages": [outcome[tool_call["id"]] for tool_call in tool_calls],
+        "dirty": saved_versions.get(save_path, 0) != document_version,
+        "saved": final_saves > saves,
+        "autosave_path": autosave_path,
+    }
+    if new_edits:
+        # Only the edits are checkpointed, never the whole text
+        changes["document_edits"] = list(new_edits)
+        changes["document_id"] = document_id
+        changes["last_edit_line"] = last_edit_line
+    return changes
+
+
 graph = StateGraph(AgentState)
 
 graph.add_node("agent", our_agent)
-graph.add_node("tools", ToolNode(tools))
+graph.add_node("tools", run_tools)
 
 graph.set_entry_point("agent")
 
@@ -126,16 +420,25 @@ graph.add_conditional_edges(
     },
 )
 
-app = graph.compile()
+app = graph.compile(checkpointer=get_checkpointer())
 
 def run_document_agent():
     print("\n ===== DRAFTER =====")
     
-    state = {"messages": []}
+    state = {"messages": [], "dirty": False, "saved": False}
+    config = thread_config()
+    print(f"Conversation: {config['configurable']['thread_id']}")
     
-    for step in app.stream(state, stream_mode="values"):
-        if "messages" in step:
-            print_messages(step["messages"])
+    try:
+        for step in app.stream(state, config, stream_mode="values"):
+            if "messages" in step:
+                print_messages(step["messages"])
+    except (KeyboardInterrupt, EOFError):
+        if app.get_state(config).values.get("dirty"):
+            print(
+                "\n⚠️ The document has unsaved changes. Resume with "
+                f"THREAD_ID={config['configurable']['thread_id']} to save them."
+            )
     
     print("\n ===== DRAFTER FINISHED =====")
 
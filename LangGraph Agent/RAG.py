@@ -1,74 +1,175 @@
 from dotenv import load_dotenv
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from langgraph.graph import StateGraph, END
 from typing import TypedDict, Annotated, Sequence
 from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, ToolMessage
 from operator import add as add_messages
 from langchain_groq import ChatGroq
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
 from langchain_core.tools import tool
-from langchain_huggingface import HuggingFaceEmbeddings
+from embedding_service import get_embedding_service
+from ingest import ingest_paths, manifest_version
+from hybrid_retrieval import CrossEncoderReranker, HybridRetriever
+from history import HistoryCompactor
+from checkpointer import get_checkpointer, thread_config
 
 load_dotenv()
-os.environ["TOKENIZERS_PARALLELISM"] = "false"  # Fix tokenizer warning
 
 # Initialize the LLM and embeddings
 llm = ChatGroq(model="meta-llama/llama-4-maverick-17b-128e-instruct")
+# Only recent turns within the budget are resent; older ones are summarized
+history = HistoryCompactor(llm, max_tokens=int(os.environ.get("HISTORY_TOKENS", 4000)))
 pdf_path = "Stock_Market_Performance_2024.pdf"
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+# Shared, warm model; concurrent retriever queries are embedded in micro-batches
+embeddings = get_embedding_service(
+    "sentence-transformers/all-MiniLM-L6-v2",
+    num_threads=int(os.environ.get("EMBEDDING_THREADS", 0)) or None,
+)
 
 # Define state
+def merge_dicts(left: dict, right: dict) -> dict:
+    return {**left, **right}
+
 class AgentState(TypedDict):
     messages: Annotated[Sequence[BaseMessage], add_messages]
+    # "<collection version>:<normalized query>" -> chunk IDs it returned
+    # earlier in this conversation
+    retrievals: Annotated[dict, merge_dicts]
+    # Chunk ID -> [turn, short label] of every chunk already shown to the model
+    seen_chunks: Annotated[dict, merge_dicts]
 
 # Load and process PDF
 if not os.path.exists(pdf_path):
     raise FileNotFoundError(f"The specified PDF file does not exist: {pdf_path}")
 
-try:
-    pdf_loader = PyPDFLoader(pdf_path)
-    pages = pdf_loader.load()
-    print(f"PDF loaded successfully with {len(pages)} pages")
-except Exception as e:
-    print(f"Error loading PDF: {e}")
-    raise
-
-# Chunk documents
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-pages_split = text_splitter.split_documents(pages)
-
 # Set up Chroma vector store
 persist_directory = r"/Users/adityakapadia/My PC/LangGraph Agent"
 collection_name = "stock_market"
+# Records, per ingested PDF, the file hash plus every page's content hash and
+# chunk IDs, so unchanged PDFs are never parsed again and changed ones only
+# re-embed the pages that actually changed. Shared with ingest.py, which is
+# the way to index a whole directory of PDFs in parallel.
+manifest_path = os.path.join(persist_directory, f"{collection_name}_manifest.json")
 
 if not os.path.exists(persist_directory):
     os.makedirs(persist_directory)
 
 try:
-    # Check if Chroma database exists; load it if present, else create new
-    try:
-        vectorstore = Chroma(
-            persist_directory=persist_directory,
-            collection_name=collection_name,
-            embedding_function=embeddings
-        )
-        print("Loaded existing Chroma vector store")
-    except Exception:
-        vectorstore = Chroma.from_documents(
-            documents=pages_split,
-            embedding=embeddings,
-            persist_directory=persist_directory,
-            collection_name=collection_name
-        )
-        print("Created new Chroma vector store")
+    vectorstore = Chroma(
+        persist_directory=persist_directory,
+        collection_name=collection_name,
+        embedding_function=embeddings
+    )
+    print("Loaded Chroma vector store")
 except Exception as e:
     print(f"Error setting up ChromaDB: {str(e)}")
     raise
 
-# Create retriever
-retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 5})
+ingest_paths([pdf_path], vectorstore, manifest_path, workers=0)
+
+def normalize_query(query: str) -> str:
+    return " ".join(re.findall(r"\w+", query.lower()))
+
+# (mtime, size) of the manifest last read -> the version recorded in it
+_manifest_version = (None, "")
+
+def collection_version() -> str:
+    """Changes whenever ingestion adds or deletes chunks in the collection."""
+    global _manifest_version
+    try:
+        stat = os.stat(manifest_path)
+    except FileNotFoundError:
+        return ""
+    # The manifest is only parsed again after it was rewritten
+    key = (stat.st_mtime_ns, stat.st_size)
+    if _manifest_version[0] != key:
+        _manifest_version = (key, manifest_version(manifest_path))
+    return _manifest_version[1]
+
+class RetrievalCache:
+    """Process-wide LRU of search results, shared by every conversation."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+# Create retriever: BM25 over the collection's chunks fused with Chroma
+# similarity, so exact tickers and figures are found on the first try.
+# RAG_RETRIEVAL=vector switches back to similarity only, e.g. to compare the
+# two with benchmark_rag.py; RERANK_MODEL enables a CPU cross-encoder pass.
+reranker = None
+if os.environ.get("RERANK_MODEL"):
+    reranker = CrossEncoderReranker(
+        os.environ["RERANK_MODEL"],
+        max_candidates=int(os.environ.get("RERANK_CANDIDATES", 20)),
+    )
+retriever = HybridRetriever(
+    vectorstore,
+    version=collection_version,
+    k=5,
+    reranker=reranker,
+    lexical=os.environ.get("RAG_RETRIEVAL", "hybrid") == "hybrid",
+)
+
+retrieval_cache = RetrievalCache()
+# Chunk ID -> text of every chunk the global cache has handed out, so a
+# conversation's own cache only needs to remember IDs
+chunk_texts = {}
+
+def retrieve(query: str, vector: list[float] | None = None) -> list[str]:
+    """Return the IDs of the top chunks for ``query``, searching only on a cache miss."""
+    key = (collection_version(), normalize_query(query))
+    chunk_ids = retrieval_cache.get(key)
+    if chunk_ids is not None:
+        return chunk_ids
+    chunk_ids = []
+    for chunk_id, text in retriever.search(query, vector):
+        chunk_texts[chunk_id] = text
+        chunk_ids.append(chunk_id)
+    retrieval_cache.put(key, chunk_ids)
+    return chunk_ids
+
+def format_docs(chunk_ids: list[str], seen_chunks: dict | None = None, first_label: int = 1) -> tuple[str, dict]:
+    """Render chunks for the model, referencing ones it can still see.
+
+    ``seen_chunks`` maps chunk IDs to their labels; new chunks are labelled
+    from ``first_label`` on. Returns the text and the labels of new chunks.
+    """
+    if not chunk_ids:
+        return "No relevant information found in the Stock Market Performance 2024 document.", {}
+    seen_chunks = seen_chunks or {}
+    new_chunks = {}
+    results = []
+    for i, chunk_id in enumerate(chunk_ids):
+        label = seen_chunks.get(chunk_id) or new_chunks.get(chunk_id)
+        if label:
+            results.append(f"Document {i+1}: same as [{label}] above.")
+            continue
+        label = f"C{first_label + len(new_chunks)}"
+        new_chunks[chunk_id] = label
+        results.append(f"Document {i+1} [{label}]:\n{chunk_texts[chunk_id]}")
+    return "\n\n".join(results), new_chunks
 
 @tool
 def retriever_tool(query: str) -> str:
@@ -76,11 +177,7 @@ def retriever_tool(query: str) -> str:
     Searches and returns information from the Stock Market Performance 2024 document.
     """
     try:
-        docs = retriever.invoke(query)
-        if not docs:
-            return "No relevant information found in the Stock Market Performance 2024 document."
-        results = [f"Document {i+1}:\n{doc.page_content}" for i, doc in enumerate(docs)]
-        return "\n\n".join(results)
+        return format_docs(retrieve(query))[0]
     except Exception as e:
         return f"Error retrieving documents: {str(e)}"
 
@@ -99,25 +196,117 @@ Cite specific parts of the documents in your answers.
 # Define nodes
 def call_llm(state: AgentState) -> AgentState:
     """Call the LLM with the current state."""
-    messages = [SystemMessage(content=system_prompt)] + list(state.messages)
+    messages = [SystemMessage(content=system_prompt)] + history.compact(state["messages"])
     message = llm.invoke(messages)
     return {"messages": [message]}
 
+def should_continue(state: AgentState) -> bool:
+    """Check if the last message contains tool calls."""
+    result = state["messages"][-1]
+    return hasattr(result, "tool_calls") and len(result.tool_calls) > 0
+
+# Tool calls from one turn run concurrently, so a turn takes as long as its
+# slowest call rather than the sum of all of them
+tool_executor = ThreadPoolExecutor(max_workers=8)
+tool_timeout = float(os.environ.get("TOOL_TIMEOUT", 30))
+
 def take_action(state: AgentState) -> AgentState:
     """Execute tool calls from the LLM's response."""
     tool_calls = state["messages"][-1].tool_calls
-    results = []
+    retrievals = state.get("retrievals") or {}
+    version = collection_version()
+
+    def conversation_key(query: str) -> str:
+        # Keyed by collection version too, so a re-ingest invalidates it
+        return f"{version}:{normalize_query(query)}"
+
+    def answered(query: str) -> bool:
+        """Whether this conversation already ran ``query``."""
+        chunk_ids = retrievals.get(conversation_key(query))
+        # Chunk texts live in memory, so a conversation resumed in a new
+        # process searches again
+        return chunk_ids is not None and all(c in chunk_texts for c in chunk_ids)
+
+    # Only chunks shown earlier in this turn may be referenced: the history
+    # compactor trims earlier turns' tool results or summarizes them away
+    turn = sum(isinstance(m, HumanMessage) for m in state["messages"])
+    shown_before = [v for v in (state.get("seen_chunks") or {}).values() if isinstance(v, list)]
+    seen_chunks = {
+        chunk_id: v[1]
+        for chunk_id, v in (state.get("seen_chunks") or {}).items()
+        if isinstance(v, list) and v[0] == turn
+    }
+    # Labels stay unique across the conversation, so a trimmed "[C3]" from an
+    # earlier turn never looks like a chunk shown now
+    next_label = 1 + max((int(label[1:]) for _, label in shown_before), default=0)
+    started = time.monotonic()
+
+    # Queries this conversation has already run are answered from its own
+    # cache, and ones another conversation ran from the global one; the rest
+    # are embedded together in a single batch
+    queries = [
+        t["args"].get("query", "") for t in tool_calls
+        if t["name"] == retriever_tool.name
+        and not answered(t["args"].get("query", ""))
+        and retrieval_cache.get((version, normalize_query(t["args"].get("query", "")))) is None
+    ]
+    vectors = {}
+    if len(queries) > 1:
+        try:
+            vectors = dict(zip(queries, embeddings.embed_documents(queries)))
+        except Exception as e:
+            print(f"Batched embedding failed, searching one by one: {e}")
+
+    futures = []
     for t in tool_calls:
+        query = t["args"].get("query", "")
         print(f"Calling Tool: {t['name']} with query: {t['args'].get('query', 'No query provided')}")
         if t["name"] not in tools_dict:
             print(f"Tool: {t['name']} does not exist.")
+            futures.append(None)
+        elif t["name"] == retriever_tool.name:
+            if answered(query):
+                futures.append("cached")
+            else:
+                futures.append(tool_executor.submit(retrieve, query, vectors.get(query)))
+        else:
+            futures.append(tool_executor.submit(tools_dict[t["name"]].invoke, query))
+
+    results = []
+    new_retrievals = {}
+    new_chunks = {}
+    for t, future in zip(tool_calls, futures):
+        if future is None:
             result = "Incorrect Tool Name. Please retry with available tools."
+        elif future == "cached":
+            print("Answered from this conversation's retrieval cache")
+            result, shown = format_docs(retrievals[conversation_key(t["args"].get("query", ""))], seen_chunks, next_label)
+            seen_chunks.update(shown)
+            new_chunks.update(shown)
+            next_label += len(shown)
         else:
-            result = tools_dict[t["name"]].invoke(t["args"].get("query", ""))
-            print(f"Result length: {len(str(result))}")
+            try:
+                result = future.result(timeout=max(0, started + tool_timeout - time.monotonic()))
+                if t["name"] == retriever_tool.name:
+                    new_retrievals[conversation_key(t["args"].get("query", ""))] = result
+                    result, shown = format_docs(result, seen_chunks, next_label)
+                    seen_chunks.update(shown)
+                    new_chunks.update(shown)
+                    next_label += len(shown)
+                print(f"Result length: {len(str(result))}")
+            except FutureTimeoutError:
+                future.cancel()
+                print(f"Tool: {t['name']} timed out after {tool_timeout}s")
+                result = f"Tool call timed out after {tool_timeout} seconds. Please retry."
+            except Exception as e:
+                result = f"Error running tool: {str(e)}"
         results.append(ToolMessage(tool_call_id=t["id"], name=t["name"], content=str(result)))
     print("Tools Execution Complete. Back to the model!")
-    return {"messages": results}
+    return {
+        "messages": results,
+        "retrievals": new_retrievals,
+        "seen_chunks": {chunk_id: [turn, label] for chunk_id, label in new_chunks.items()},
+    }
 
 # Build and compile graph
 graph = StateGraph(AgentState)
@@ -126,17 +315,19 @@ graph.add_node("retriever_agent", take_action)
 graph.add_conditional_edges("llm", should_continue, {True: "retriever_agent", False: END})
 graph.add_edge("retriever_agent", "llm")
 graph.set_entry_point("llm")
-rag_agent = graph.compile()
+rag_agent = graph.compile(checkpointer=get_checkpointer())
 
 # Run the agent
 def running_agent():
     print("\n=== RAG AGENT ===")
+    config = thread_config()
+    print(f"Conversation: {config['configurable']['thread_id']}")
     while True:
         user_input = input("\nWhat is your question: ")
         if user_input.lower() in ["exit", "quit"]:
             break
         messages = [HumanMessage(content=user_input)]
-        result = rag_agent.invoke({"messages": messages})
+        result = rag_agent.invoke({"messages": messages}, config)
         print("\n=== ANSWER ===")
         print(result["messages"][-1].content)
 
@@ -0,0 +1,63 @@
+"""Count the LLM <-> tool round-trips the RAG agent needs per answer.
+
+    python benchmark_rag.py questions.txt --mode vector
+    python benchmark_rag.py questions.txt --mode hybrid
+
+``questions.txt`` holds one question per line. Fewer round-trips per answer
+means retrieval found what the model needed earlier.
+"""
+
+import argparse
+import os
+import statistics
+import time
+import uuid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("questions", help="A text file with one question per line")
+    parser.add_argument("--mode", choices=["hybrid", "vector"], default="hybrid")
+    args = parser.parse_args()
+
+    # RAG reads the retrieval mode when it builds its retriever at import
+    os.environ["RAG_RETRIEVAL"] = args.mode
+    from langchain_core.messages import HumanMessage
+    from checkpointer import thread_config
+    from RAG import rag_agent
+
+    with open(args.questions) as f:
+        questions = [line.strip() for line in f if line.strip()]
+
+    rounds, calls, seconds = [], [], []
+    for question in questions:
+        tool_rounds = tool_calls = 0
+        started = time.monotonic()
+        updates = rag_agent.stream(
+            {"messages": [HumanMessage(content=question)]},
+            # A fresh conversation per question, so answers don't share context
+            thread_config(uuid.uuid4().hex),
+            stream_mode="updates",
+        )
+        for update in updates:
+            if "retriever_agent" in update:
+                tool_rounds += 1
+                tool_calls += len(update["retriever_agent"]["messages"])
+        rounds.append(tool_rounds)
+        calls.append(tool_calls)
+        seconds.append(time.monotonic() - started)
+        print(
+            f"{tool_rounds} round-trips, {tool_calls} tool calls, "
+            f"{seconds[-1]:.1f}s: {question}"
+        )
+
+    print(
+        f"\n{args.mode}: {len(questions)} questions, "
+        f"{statistics.mean(rounds):.2f} round-trips/answer (max {max(rounds)}), "
+        f"{statistics.mean(calls):.2f} tool calls/answer, "
+        f"{statistics.mean(seconds):.1f}s/answer"
+    )
+
+
+if __name__ == "__main__":
+    main()
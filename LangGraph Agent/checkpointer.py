@@ -0,0 +1,652 @@
+"""SQLite checkpointer shared by the agents in this folder.
+
+Compiling a graph with it and passing a ``thread_id`` lets a conversation
+survive restarts and move between workers: each turn only sends the new
+message, the rest of the state is loaded from the database.
+
+- The database runs in WAL mode, and writes are batched: ``put`` and
+  ``put_writes`` only queue rows, which a background thread commits together
+  every few milliseconds. Reads flush the queue first, so they always see
+  earlier writes.
+- Channel values are stored once per version, like LangGraph's own savers.
+  Message lists (and Drafter's edit log) are delta encoded: each item is
+  stored once per thread under its content hash, and a checkpoint's list is
+  just the hashes.
+- ``evict`` keeps each thread's latest checkpoints and drops threads by age
+  and total size. It runs periodically on its own.
+"""
+
+import asyncio
+import atexit
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Iterator, Sequence
+from typing import Any
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS checkpoints (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL,
+        checkpoint_id TEXT NOT NULL,
+        parent_checkpoint_id TEXT,
+        checkpoint_type TEXT NOT NULL,
+        checkpoint BLOB NOT NULL,
+        metadata_type TEXT NOT NULL,
+        metadata BLOB NOT NULL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS blobs (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL,
+        channel TEXT NOT NULL,
+        version TEXT NOT NULL,
+        type TEXT NOT NULL,
+        value BLOB,
+        PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+    )""",
+    """CREATE TABLE IF NOT EXISTS writes (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL,
+        checkpoint_id TEXT NOT NULL,
+        task_id TEXT NOT NULL,
+        idx INTEGER NOT NULL,
+        channel TEXT NOT NULL,
+        type TEXT NOT NULL,
+        value BLOB,
+        task_path TEXT NOT NULL,
+        PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+    )""",
+    """CREATE TABLE IF NOT EXISTS messages (
+        thread_id TEXT NOT NULL,
+        digest BLOB NOT NULL,
+        type TEXT NOT NULL,
+        value BLOB,
+        PRIMARY KEY (thread_id, digest)
+    ) WITHOUT ROWID""",
+)
+
+# Bytes of a message's content hash in a delta-encoded message list
+DIGEST_SIZE = 16
+INSERT_MESSAGE = (
+    "INSERT OR IGNORE INTO messages (thread_id, digest, type, value) VALUES (?, ?, ?, ?)"
+)
+
+
+class SQLiteCheckpointer(BaseCheckpointSaver):
+    def __init__(
+        self,
+        path: str = "checkpoints.sqlite",
+        flush_interval: float = 0.05,
+        max_batch: int = 256,
+        delta_channels: Sequence[str] = ("messages", "document_edits"),
+        keep_checkpoints: int = 20,
+        max_age_days: float = 30,
+        max_bytes: int = 512 * 1024 * 1024,
+        evict_every: int = 1000,
+    ):
+        super().__init__()
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.delta_channels = set(delta_channels)
+        self.keep_checkpoints = keep_checkpoints
+        self.max_age = max_age_days * 24 * 3600
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        for pragma in (
+            "PRAGMA journal_mode = WAL",
+            "PRAGMA synchronous = NORMAL",
+            "PRAGMA busy_timeout = 5000",
+        ):
+            self._conn.execute(pragma)
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        self._lock = threading.RLock()
+        # Held while a put decides which messages are already stored, and by
+        # eviction, so no message row is deleted under a put that relies on it
+        self._evict_lock = threading.Lock()
+
+        # Rows waiting to be committed, as (sql, params)
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        # (thread_id, digest) of messages committed, and of messages queued
+        self._stored_messages = set()
+        self._queued_messages = set()
+        self._puts = 0
+        self._closed = False
+        self._wakeup = threading.Event()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def get_next_version(self, current: str | int | None, channel: None = None) -> str:
+        """A new, unique channel version.
+
+        Blobs are stored per (channel, version), so a version must never be
+        handed out twice. Forking or replaying from an older checkpoint would
+        otherwise overwrite blobs that later checkpoints still use. The random
+        suffix keeps versions unique; the zero-padded counter keeps them ordered.
+        """
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # -- batched writes ----------------------------------------------------
+
+    def _queue(self, statements: list[tuple[str, tuple]]):
+        with self._pending_lock:
+            self._pending.extend(statements)
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Commit every queued write in one transaction.
+
+        If the commit fails, the rows go back to the front of the queue, so
+        they are retried with the next flush, and the error is raised.
+        """
+        with self._lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    # Consecutive rows for the same statement go in one executemany
+                    start = 0
+                    for end in range(1, len(pending) + 1):
+                        if end == len(pending) or pending[end][0] != pending[start][0]:
+                            self._conn.executemany(
+                                pending[start][0], [params for _, params in pending[start:end]]
+                            )
+                            start = end
+                except BaseException:
+                    self._conn.rollback()
+                    raise
+                else:
+                    self._conn.commit()
+            except BaseException:
+                with self._pending_lock:
+                    self._pending[:0] = pending
+                raise
+            committed = {params[:2] for sql, params in pending if sql == INSERT_MESSAGE}
+            with self._pending_lock:
+                self._stored_messages |= committed
+                self._queued_messages -= committed
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                if self._puts >= self.evict_every:
+                    self._puts = 0
+                    self.evict()
+            except Exception as e:
+                print(f"Checkpoint write failed, will retry: {e}")
+
+    def close(self):
+        """Commit what is queued and close the database."""
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._worker.join()
+        self.flush()
+        self._conn.close()
+
+    # -- reads -------------------------------------------------------------
+
+    def _query(self, sql: str, params: Sequence = ()) -> list[tuple]:
+        self.flush()
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _load_messages(self, thread_id: str, refs: bytes) -> list:
+        digests = [refs[i : i + DIGEST_SIZE] for i in range(0, len(refs), DIGEST_SIZE)]
+        stored = {}
+        # Stay well below SQLite's bound parameter limit
+        for start in range(0, len(digests), 500):
+            batch = digests[start : start + 500]
+            rows = self._query(
+                "SELECT digest, type, value FROM messages WHERE thread_id = ?"
+                f" AND digest IN ({', '.join('?' * len(batch))})",
+                [thread_id, *batch],
+            )
+            stored.update((digest, (type_, value)) for digest, type_, value in rows)
+        missing = len({digest for digest in digests if digest not in stored})
+        if missing:
+            raise LookupError(
+                f"Checkpoint of thread {thread_id!r} refers to {missing} message(s)"
+                " missing from the messages table"
+            )
+        return [self.serde.loads_typed(stored[digest]) for digest in digests]
+
+    def _load_values(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> dict:
+        values = {}
+        for channel, version in versions.items():
+            rows = self._query(
+                "SELECT type, value FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?"
+                " AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            )
+            if not rows or rows[0][0] == "empty":
+                continue
+            type_, value = rows[0]
+            if type_ == "message_refs":
+                values[channel] = self._load_messages(thread_id, value)
+            else:
+                values[channel] = self.serde.loads_typed((type_, value))
+        return values
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, row: tuple) -> CheckpointTuple:
+        checkpoint_id, parent_id, checkpoint_type, checkpoint, metadata_type, metadata = row
+        checkpoint = self.serde.loads_typed((checkpoint_type, checkpoint))
+        writes = self._query(
+            "SELECT task_id, channel, type, value FROM writes"
+            " WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?"
+            " ORDER BY task_path, task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        )
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_values(
+                    thread_id, checkpoint_ns, checkpoint["channel_versions"]
+                ),
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((type_, value)))
+                for task_id, channel, type_, value in writes
+            ],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        sql = (
+            "SELECT checkpoint_id, parent_checkpoint_id, checkpoint_type, checkpoint,"
+            " metadata_type, metadata FROM checkpoints"
+            " WHERE thread_id = ? AND checkpoint_ns = ?"
+        )
+        params = [thread_id, checkpoint_ns]
+        if checkpoint_id := get_checkpoint_id(config):
+            sql += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        rows = self._query(sql + " ORDER BY checkpoint_id DESC LIMIT 1", params)
+        return self._tuple(thread_id, checkpoint_ns, rows[0]) if rows else None
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        clauses, params = [], []
+        if config:
+            configurable = config["configurable"]
+            clauses.append("thread_id = ?")
+            params.append(configurable["thread_id"])
+            if "checkpoint_ns" in configurable:
+                clauses.append("checkpoint_ns = ?")
+                params.append(configurable["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._query(
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id,"
+            " checkpoint_type, checkpoint, metadata_type, metadata FROM checkpoints"
+            f"{where} ORDER BY checkpoint_id DESC",
+            params,
+        )
+        found = 0
+        for thread_id, checkpoint_ns, *row in rows:
+            if filter:
+                metadata = self.serde.loads_typed((row[4], row[5]))
+                if any(metadata.get(key) != value for key, value in filter.items()):
+                    continue
+            yield self._tuple(thread_id, checkpoint_ns, row)
+            found += 1
+            if limit is not None and found >= limit:
+                return
+
+    # -- writes ------------------------------------------------------------
+
+    def _message_refs(self, thread_id: str, messages: list, statements: list) -> bytes:
+        """Hashes of serialized ``messages``, queueing rows for unknown ones.
+
+        Callers hold ``_evict_lock`` until the statements are queued, so a
+        message found stored is not evicted in the meantime.
+        """
+        refs = []
+        for message in messages:
+            type_, value = self.serde.dumps_typed(message)
+            digest = hashlib.sha256(type_.encode() + b"\0" + value).digest()[:DIGEST_SIZE]
+            key = (thread_id, digest)
+            with self._pending_lock:
+                known = key in self._stored_messages or key in self._queued_messages
+                # Only marked stored once its row is committed (see ``flush``)
+                self._queued_messages.add(key)
+            if not known:
+                statements.append((INSERT_MESSAGE, (thread_id, digest, type_, value)))
+            refs.append(digest)
+        return b"".join(refs)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint = checkpoint.copy()
+        values = checkpoint.pop("channel_values")
+
+        checkpoint_type, checkpoint_value = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_value = self.serde.dumps_typed(
+            get_checkpoint_metadata(config, metadata)
+        )
+        checkpoint_row = (
+            "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id,"
+            " parent_checkpoint_id, checkpoint_type, checkpoint, metadata_type, metadata,"
+            " created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                thread_id,
+                checkpoint_ns,
+                checkpoint["id"],
+                config["configurable"].get("checkpoint_id"),
+                checkpoint_type,
+                checkpoint_value,
+                metadata_type,
+                metadata_value,
+                time.time(),
+            ),
+        )
+        # Exclusive with eviction until queued (see ``_message_refs``)
+        with self._evict_lock:
+            statements = []
+            # Only channels that changed since the parent are written
+            for channel, version in new_versions.items():
+                if channel not in values:
+                    type_, value = "empty", b""
+                elif channel in self.delta_channels and isinstance(values[channel], list):
+                    type_ = "message_refs"
+                    value = self._message_refs(thread_id, values[channel], statements)
+                else:
+                    type_, value = self.serde.dumps_typed(values[channel])
+                statements.append(
+                    (
+                        "INSERT OR REPLACE INTO blobs"
+                        " (thread_id, checkpoint_ns, channel, version, type, value)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        (thread_id, checkpoint_ns, channel, str(version), type_, value),
+                    )
+                )
+            statements.append(checkpoint_row)
+            self._queue(statements)
+        self._puts += 1
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        configurable = config["configurable"]
+        statements = []
+        for idx, (channel, value) in enumerate(writes):
+            idx = WRITES_IDX_MAP.get(channel, idx)
+            type_, value = self.serde.dumps_typed(value)
+            # Special writes (errors, interrupts) replace earlier ones,
+            # regular writes are only stored once
+            verb = "INSERT OR REPLACE" if idx < 0 else "INSERT OR IGNORE"
+            statements.append(
+                (
+                    f"{verb} INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id,"
+                    " idx, channel, type, value, task_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        configurable["thread_id"],
+                        configurable.get("checkpoint_ns", ""),
+                        configurable["checkpoint_id"],
+                        task_id,
+                        idx,
+                        channel,
+                        type_,
+                        value,
+                        task_path,
+                    ),
+                )
+            )
+        self._queue(statements)
+
+    # -- compaction and eviction ---------------------------------------------
+
+    def _delete_threads(self, thread_ids: Sequence[str]):
+        for table in ("checkpoints", "blobs", "writes", "messages"):
+            self._conn.executemany(
+                f"DELETE FROM {table} WHERE thread_id = ?", [(t,) for t in thread_ids]
+            )
+
+    def _collect_garbage(self, thread_id: str):
+        """Delete the blobs, writes and messages no remaining checkpoint uses."""
+        conn = self._conn
+        live = set()
+        for checkpoint_ns, type_, value in conn.execute(
+            "SELECT checkpoint_ns, checkpoint_type, checkpoint FROM checkpoints"
+            " WHERE thread_id = ?",
+            (thread_id,),
+        ).fetchall():
+            versions = self.serde.loads_typed((type_, value))["channel_versions"]
+            live.update((checkpoint_ns, channel, str(v)) for channel, v in versions.items())
+
+        dead, digests = [], set()
+        for checkpoint_ns, channel, version, type_, value in conn.execute(
+            "SELECT checkpoint_ns, channel, version, type, value FROM blobs WHERE thread_id = ?",
+            (thread_id,),
+        ).fetchall():
+            if (checkpoint_ns, channel, version) not in live:
+                dead.append((thread_id, checkpoint_ns, channel, version))
+            elif type_ == "message_refs":
+                digests.update(value[i : i + DIGEST_SIZE] for i in range(0, len(value), DIGEST_SIZE))
+        conn.executemany(
+            "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ?"
+            " AND version = ?",
+            dead,
+        )
+        stored = conn.execute("SELECT digest FROM messages WHERE thread_id = ?", (thread_id,))
+        conn.executemany(
+            "DELETE FROM messages WHERE thread_id = ? AND digest = ?",
+            [(thread_id, digest) for digest, in stored.fetchall() if digest not in digests],
+        )
+        conn.execute(
+            "DELETE FROM writes WHERE thread_id = ? AND NOT EXISTS (SELECT 1 FROM checkpoints c"
+            " WHERE c.thread_id = writes.thread_id AND c.checkpoint_ns = writes.checkpoint_ns"
+            " AND c.checkpoint_id = writes.checkpoint_id)",
+            (thread_id,),
+        )
+
+    def _keep_latest(self, keep: int, thread_ids: Sequence[str] | None = None):
+        where = ""
+        params = [keep]
+        if thread_ids is not None:
+            where = f" WHERE thread_id IN ({', '.join('?' * len(thread_ids))})"
+            params = [*thread_ids, keep]
+        compacted = self._conn.execute(
+            "SELECT DISTINCT thread_id FROM (SELECT thread_id, ROW_NUMBER() OVER ("
+            " PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS n"
+            f" FROM checkpoints{where}) WHERE n > ?",
+            params,
+        ).fetchall()
+        self._conn.execute(
+            "DELETE FROM checkpoints WHERE rowid IN (SELECT rowid FROM (SELECT rowid,"
+            " ROW_NUMBER() OVER (PARTITION BY thread_id, checkpoint_ns"
+            f" ORDER BY checkpoint_id DESC) AS n FROM checkpoints{where}) WHERE n > ?)",
+            params,
+        )
+        for thread_id, in compacted:
+            self._collect_garbage(thread_id)
+
+    def _transaction(self, work):
+        # Checkpoints queued before this point are committed first, so the
+        # messages they refer to count as live; later puts wait until the
+        # stored set is cleared and then write their messages again
+        with self._evict_lock, self._lock:
+            self.flush()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                work()
+            except BaseException:
+                self._conn.rollback()
+                raise
+            else:
+                self._conn.commit()
+            # Evicted messages must be written again if they come back
+            with self._pending_lock:
+                self._stored_messages.clear()
+
+    def evict(self):
+        """Compact every thread to its latest checkpoints, then drop old threads
+        and, least recently used first, threads beyond the size budget."""
+
+        def work():
+            stale = self._conn.execute(
+                "SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(created_at) < ?",
+                (time.time() - self.max_age,),
+            ).fetchall()
+            self._delete_threads([thread_id for thread_id, in stale])
+            self._keep_latest(self.keep_checkpoints)
+
+            sizes = self._conn.execute(
+                "SELECT thread_id, SUM(size), MAX(updated) FROM ("
+                " SELECT thread_id, LENGTH(checkpoint) + LENGTH(metadata) AS size,"
+                " created_at AS updated FROM checkpoints"
+                " UNION ALL SELECT thread_id, LENGTH(value), NULL FROM blobs"
+                " UNION ALL SELECT thread_id, LENGTH(value), NULL FROM writes"
+                " UNION ALL SELECT thread_id, LENGTH(value), NULL FROM messages"
+                ") GROUP BY thread_id ORDER BY MAX(updated)"
+            ).fetchall()
+            total = sum(size or 0 for _, size, _ in sizes)
+            evicted = []
+            for thread_id, size, _ in sizes:
+                if total <= self.max_bytes:
+                    break
+                evicted.append(thread_id)
+                total -= size or 0
+            self._delete_threads(evicted)
+
+        self._transaction(work)
+
+    def delete_thread(self, thread_id: str) -> None:
+        self._transaction(lambda: self._delete_threads([thread_id]))
+
+    def prune(self, thread_ids: Sequence[str], *, strategy: str = "keep_latest") -> None:
+        if strategy == "delete":
+            self._transaction(lambda: self._delete_threads(thread_ids))
+        else:
+            self._transaction(lambda: self._keep_latest(1, list(thread_ids)))
+
+    # -- async -------------------------------------------------------------
+    # Writes only queue rows, so they run inline; reads go to a worker thread
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path: str = "") -> None:
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+_checkpointers = {}
+_checkpointers_lock = threading.Lock()
+
+
+def get_checkpointer(path: str | None = None) -> SQLiteCheckpointer:
+    """Return the process-wide checkpointer for ``path`` (``CHECKPOINT_DB`` by default)."""
+    path = path or os.environ.get("CHECKPOINT_DB", "checkpoints.sqlite")
+    with _checkpointers_lock:
+        if path not in _checkpointers:
+            _checkpointers[path] = SQLiteCheckpointer(path)
+        return _checkpointers[path]
+
+
+def thread_config(thread_id: str | None = None) -> RunnableConfig:
+    """Run config for one conversation.
+
+    ``THREAD_ID`` in the environment resumes that conversation; otherwise a
+    new one is started.
+    """
+    thread_id = thread_id or os.environ.get("THREAD_ID") or uuid.uuid4().hex
+    return {"configurable": {"thread_id": thread_id}}
@@ -0,0 +1,88 @@
+"""One shared, warm sentence-transformers model for every RAG session.
+
+Concurrent ``embed_query`` calls are collected for a few milliseconds and
+encoded together as one batch on a single service thread, so many sessions
+get batched CPU throughput instead of queueing up single-sentence encodes.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+
+# Only the service thread tokenizes, and in batches, so let the tokenizer use
+# its own thread pool unless the environment says otherwise
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "true")
+
+
+class BatchedEmbeddings(Embeddings):
+    def __init__(
+        self,
+        model_name: str,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        num_threads: int | None = None,
+    ):
+        if num_threads:
+            import torch
+
+            torch.set_num_threads(num_threads)
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._model = HuggingFaceEmbeddings(
+            model_name=model_name, encode_kwargs={"batch_size": max_batch_size}
+        )
+        # Serializes access to the model between the batcher and bulk
+        # embed_documents calls, so they never fight over the CPU threads
+        self._model_lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with self._model_lock:
+            return self._model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        future = Future()
+        self._requests.put((text, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                # No query_encode_kwargs are set, so queries encode like documents
+                vectors = self.embed_documents([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), vector in zip(batch, vectors):
+                    future.set_result(vector)
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_embedding_service(model_name: str, **kwargs) -> BatchedEmbeddings:
+    """Return the process-wide service for ``model_name``, loading it once."""
+    with _services_lock:
+        if model_name not in _services:
+            _services[model_name] = BatchedEmbeddings(model_name, **kwargs)
+        return _services[model_name]
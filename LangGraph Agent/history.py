@@ -0,0 +1,117 @@
+"""Keeps the message history an agent sends to its LLM within a token budget.
+
+Only the most recent turns that fit the budget are sent as-is. Older turns
+are folded into a running summary that is extended incrementally and cached
+by the exact prefix it covers, so each evicted message is summarized once no
+matter how many later calls (or graph runs) see it again. Tool results from
+earlier turns are trimmed, since they are usually the bulk of the tokens.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+SUMMARY_PROMPT = """Update the running summary of a conversation with the new messages below.
+Keep names, figures, decisions, tool results that were relied on and any open questions. Be concise.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}"""
+
+
+def approximate_tokens(text: str) -> int:
+    # About four characters per token for English text; good enough for a budget
+    return len(text) // 4 + 1
+
+
+def _text(message: BaseMessage) -> str:
+    return message.content if isinstance(message.content, str) else str(message.content)
+
+
+class HistoryCompactor:
+    def __init__(
+        self,
+        llm=None,
+        max_tokens: int = 4000,
+        max_tool_chars: int = 1500,
+        count_tokens=approximate_tokens,
+        cache_size: int = 256,
+    ):
+        """``llm`` writes the summaries; without one, evicted turns are dropped."""
+        self.llm = llm
+        self.max_tokens = max_tokens
+        self.max_tool_chars = max_tool_chars
+        self.count_tokens = count_tokens
+        self.cache_size = cache_size
+        # Prefix digest -> summary of every message in that prefix
+        self._summaries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def trim(self, message: BaseMessage) -> BaseMessage:
+        """Shorten a large tool result, keeping its beginning."""
+        text = _text(message)
+        if not isinstance(message, ToolMessage) or len(text) <= self.max_tool_chars:
+            return message
+        trimmed = len(text) - self.max_tool_chars
+        content = f"{text[: self.max_tool_chars]}\n[... {trimmed} characters trimmed]"
+        return message.model_copy(update={"content": content})
+
+    def compact(self, messages: list[BaseMessage]) -> list[BaseMessage]:
+        """Return the messages to send: an optional summary plus the recent window."""
+        messages = list(messages)
+        # Turns start at a human message; cutting anywhere else could separate
+        # a tool call from its result, which the API rejects
+        turn_starts = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+        current = turn_starts[-1] if turn_starts else 0
+        # The current turn is always kept whole, earlier tool results are trimmed
+        window = [self.trim(m) for m in messages[:current]] + messages[current:]
+
+        used = sum(self.count_tokens(_text(m)) for m in window[current:])
+        start = current
+        for turn_start in reversed(turn_starts[:-1]):
+            cost = sum(self.count_tokens(_text(m)) for m in window[turn_start:start])
+            if used + cost > self.max_tokens:
+                break
+            used += cost
+            start = turn_start
+        if start == 0:
+            return window
+
+        summary = self.summarize(window[:start])
+        if not summary:
+            return window[start:]
+        return [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")] + window[start:]
+
+    def summarize(self, messages: list[BaseMessage]) -> str:
+        """Summary of ``messages``, extending the longest summarized prefix."""
+        if self.llm is None:
+            return ""
+        digests = []
+        digest = hashlib.sha256()
+        for message in messages:
+            digest.update(f"{message.type}\0{_text(message)}\0".encode("utf-8"))
+            digests.append(digest.copy().hexdigest())
+
+        with self._lock:
+            done, summary = 0, ""
+            for i in range(len(digests), 0, -1):
+                if digests[i - 1] in self._summaries:
+                    done, summary = i, self._summaries[digests[i - 1]]
+                    self._summaries.move_to_end(digests[i - 1])
+                    break
+        if done == len(messages):
+            return summary
+
+        new_messages = "\n".join(f"{m.type}: {_text(m)}" for m in messages[done:])
+        prompt = SUMMARY_PROMPT.format(summary=summary or "(none)", messages=new_messages)
+        summary = self.llm.invoke([HumanMessage(content=prompt)]).content
+
+        with self._lock:
+            self._summaries[digests[-1]] = summary
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+        return summary
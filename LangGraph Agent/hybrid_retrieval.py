@@ -0,0 +1,142 @@
+"""Hybrid lexical + vector retrieval over the RAG agent's Chroma collection.
+
+Dense similarity alone is weak at exact tokens such as tickers, index names
+and figures ("NVDA", "S&P 500", "23.3%"), which makes the agent go back for
+more retrieval rounds. Here an in-memory BM25 inverted index over the same
+chunks is fused with Chroma's ranking by reciprocal rank, and an optional
+cross-encoder reranks the top of the fused list on CPU.
+"""
+
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+
+def tokenize(text: str) -> list[str]:
+    # Keeps "23.3", "1,250" and "s&p" together so figures match exactly
+    return re.findall(r"[a-z0-9]+(?:[.,&][a-z0-9]+)*", text.lower())
+
+
+class BM25Index:
+    def __init__(self, ids: list[str], texts: list[str], k1: float = 1.5, b: float = 0.75):
+        self.ids = list(ids)
+        self.k1 = k1
+        self.b = b
+        # term -> [(document position, term frequency)]
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for doc, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((doc, tf))
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    def search(self, query: str, k: int) -> list[str]:
+        """Return the IDs of the ``k`` best matching chunks, best first."""
+        n = len(self.ids)
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc] / self.avg_length)
+                scores[doc] += idf * tf * (self.k1 + 1) / (tf + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [self.ids[doc] for doc, _ in best]
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[str]:
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] += 1 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class CrossEncoderReranker:
+    """Reorders the top ``max_candidates`` fused results with a CPU cross-encoder."""
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        max_candidates: int = 20,
+        batch_size: int = 32,
+    ):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.max_candidates = max_candidates
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+
+    def rerank(self, query: str, ids: list[str], texts: list[str]) -> list[str]:
+        ids = ids[: self.max_candidates]
+        pairs = [(query, text) for text in texts[: self.max_candidates]]
+        with self._lock:
+            scores = self.model.predict(pairs, batch_size=self.batch_size)
+        order = sorted(range(len(ids)), key=lambda i: scores[i], reverse=True)
+        return [ids[i] for i in order]
+
+
+class HybridRetriever:
+    """BM25 + Chroma similarity, fused with reciprocal rank fusion.
+
+    The BM25 index is built from the collection on first use and rebuilt
+    whenever ``version()`` changes, so it always covers the same chunks as
+    the vector store. With ``lexical=False`` this is plain similarity search.
+    """
+
+    def __init__(
+        self,
+        vectorstore,
+        version=None,
+        k: int = 5,
+        fetch_k: int = 20,
+        reranker: CrossEncoderReranker | None = None,
+        lexical: bool = True,
+        rrf_k: int = 60,
+    ):
+        self.vectorstore = vectorstore
+        self.version = version
+        self.k = k
+        self.fetch_k = fetch_k
+        self.reranker = reranker
+        self.lexical = lexical
+        self.rrf_k = rrf_k
+        self._lock = threading.Lock()
+        self._index = None
+        self._texts = {}
+        self._index_version = None
+
+    def _lexical_index(self) -> tuple[BM25Index, dict]:
+        version = self.version() if self.version else None
+        with self._lock:
+            if self._index is None or version != self._index_version:
+                data = self.vectorstore.get(include=["documents"])
+                self._texts = dict(zip(data["ids"], data["documents"]))
+                self._index = BM25Index(data["ids"], data["documents"])
+                self._index_version = version
+            return self._index, self._texts
+
+    def search(self, query: str, vector: list[float] | None = None) -> list[tuple[str, str]]:
+        """Return ``(chunk_id, text)`` for the top ``k`` chunks, best first."""
+        if vector is not None:
+            docs = self.vectorstore.similarity_search_by_vector(vector, k=self.fetch_k)
+        else:
+            docs = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        texts = {doc.id: doc.page_content for doc in docs}
+        rankings = [[doc.id for doc in docs]]
+        if self.lexical:
+            index, all_texts = self._lexical_index()
+            lexical_ids = index.search(query, self.fetch_k)
+            texts.update((chunk_id, all_texts[chunk_id]) for chunk_id in lexical_ids)
+            rankings.append(lexical_ids)
+        ranked = reciprocal_rank_fusion(rankings, self.rrf_k)
+        if self.reranker:
+            ranked = self.reranker.rerank(query, ranked, [texts[chunk_id] for chunk_id in ranked])
+        return [(chunk_id, texts[chunk_id]) for chunk_id in ranked[: self.k]]
@@ -0,0 +1,361 @@
+"""Streaming PDF ingestion into the RAG agent's Chroma collection.
+
+    python ingest.py <pdf-or-directory> [--workers N] [--batch-size N]
+
+PDFs are parsed and split in a process pool, chunks are grouped into large
+batches and embedded/written by a single writer thread. Both hand-offs are
+bounded, so memory stays flat however many PDFs there are. A manifest in the
+persist directory records each file's hash and per-page chunk IDs: unchanged
+files are skipped without being parsed, and for changed files only the pages
+whose text changed are re-embedded.
+
+Run this as its own script for large directories: process pool workers
+re-import the main module, which must therefore be cheap to import.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path: str) -> dict:
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+    return {"files": {}}
+
+
+def save_manifest(manifest: dict, manifest_path: str):
+    # A temp file of our own, so processes saving at the same time don't
+    # replace each other's half-written file
+    with tempfile.NamedTemporaryFile(
+        "w",
+        dir=os.path.dirname(manifest_path) or ".",
+        prefix=f"{os.path.basename(manifest_path)}.",
+        suffix=".tmp",
+        delete=False,
+    ) as f:
+        json.dump(manifest, f)
+    try:
+        os.replace(f.name, manifest_path)
+    except OSError:
+        os.remove(f.name)
+        raise
+
+
+def collection_digest(version: str, removed_ids: list, added_ids: list) -> str:
+    """The collection version after removing and adding these chunk IDs.
+
+    Chained from the previous version, so it only moves when chunks do and
+    readers can use it to invalidate anything derived from the collection.
+    """
+    return sha256_text(json.dumps([version, removed_ids, added_ids]))[:16]
+
+
+def manifest_version(manifest_path: str) -> str:
+    """The ``collection_digest`` recorded in the manifest, "" if none."""
+    if not os.path.exists(manifest_path):
+        return ""
+    return load_manifest(manifest_path).get("version", "")
+
+
+def find_pdfs(source: str) -> list[str]:
+    if not os.path.isdir(source):
+        return [source]
+    return sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(source)
+        for name in names
+        if name.lower().endswith(".pdf")
+    )
+
+
+def extract_pdf(
+    path: str, entry: dict, chunk_size: int = 1000, chunk_overlap: int = 200
+):
+    """Parse and split the pages of one PDF that changed since ``entry``.
+
+    Runs in a pool worker, so it only returns plain data. Returns None when
+    the file is unchanged.
+    """
+    file_hash = sha256_file(path)
+    if entry.get("sha256") == file_hash:
+        return None
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+    old_pages = entry.get("pages", {})
+    new_pages = {}
+    stale_ids, chunks = [], []
+    for number, page in enumerate(PyPDFLoader(path).lazy_load()):
+        page_hash = sha256_text(page.page_content)
+        old = old_pages.get(str(number))
+        if old and old["sha256"] == page_hash:
+            new_pages[str(number)] = old
+            continue
+        if old:
+            stale_ids.extend(old["chunk_ids"])
+        ids = []
+        for i, chunk in enumerate(splitter.split_documents([page])):
+            chunk_id = f"{path}:{number}:{page_hash[:16]}:{i}"
+            chunks.append((chunk_id, chunk.page_content, chunk.metadata))
+            ids.append(chunk_id)
+        new_pages[str(number)] = {"sha256": page_hash, "chunk_ids": ids}
+    for number, old in old_pages.items():
+        if number not in new_pages:
+            stale_ids.extend(old["chunk_ids"])
+
+    return {
+        "path": path,
+        "entry": {"sha256": file_hash, "pages": new_pages},
+        "chunks": chunks,
+        "stale_ids": stale_ids,
+    }
+
+
+class IngestStats:
+    def __init__(self, total_files: int):
+        self.total_files = total_files
+        self.files = 0
+        self.skipped = 0
+        self.failed = 0
+        self.chunks = 0
+        self.stale = 0
+        self.started = time.monotonic()
+
+    def report(self, queue_size: int = 0) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return (
+            f"{self.files}/{self.total_files} files ({self.skipped} unchanged, "
+            f"{self.failed} failed), "
+            f"{self.chunks} chunks embedded, {self.stale} removed, "
+            f"{self.files / elapsed:.1f} files/s, "
+            f"{self.chunks / elapsed:.1f} chunks/s, "
+            f"write queue {queue_size}"
+        )
+
+
+def ingest_paths(
+    paths: list[str],
+    vectorstore,
+    manifest_path: str,
+    workers: int | None = None,
+    batch_size: int = 512,
+    max_queued_batches: int = 4,
+    log_every: float = 5.0,
+) -> IngestStats:
+    """Sync ``paths`` into ``vectorstore``.
+
+    ``workers=0`` extracts in the calling process instead of a process pool,
+    which is what a single PDF wants. Chunks are written ``batch_size`` at a
+    time, so each batch is one ``embed_documents`` call on the embedder.
+
+    Files are recorded under their absolute path, so runs from different
+    working directories agree on which file is which.
+    """
+    if not os.path.exists(manifest_path):
+        # Chunks stored before the manifest existed have unknown IDs; start clean
+        vectorstore.reset_collection()
+    manifest = load_manifest(manifest_path)
+    paths = [os.path.abspath(path) for path in paths]
+    # Only rewritten when something changed: RAG.py syncs on every start
+    dirty = False
+    # Manifests written before paths were made absolute; entries that cannot
+    # be resolved from here are left alone rather than treated as deleted
+    for path in [path for path in manifest["files"] if not os.path.isabs(path)]:
+        if os.path.exists(path):
+            manifest["files"].setdefault(os.path.abspath(path), manifest["files"].pop(path))
+            dirty = True
+    stats = IngestStats(len(paths))
+    writes = queue.Queue(maxsize=max_queued_batches)
+
+    errors = []
+
+    def writer():
+        nonlocal dirty
+        last_save = time.monotonic()
+        while (item := writes.get()) is not None:
+            if errors:
+                # Keep draining so the producer never blocks on a dead writer
+                continue
+            stale_ids, chunks, finished = item
+            if not (stale_ids or chunks or finished):
+                continue
+            try:
+                if stale_ids:
+                    vectorstore.delete(ids=stale_ids)
+                    stats.stale += len(stale_ids)
+                if chunks:
+                    documents = [
+                        Document(page_content=text, metadata=meta)
+                        for _, text, meta in chunks
+                    ]
+                    vectorstore.add_documents(
+                        documents, ids=[chunk_id for chunk_id, _, _ in chunks]
+                    )
+                    stats.chunks += len(chunks)
+            except Exception as e:
+                errors.append(e)
+                continue
+            if stale_ids or chunks:
+                manifest["version"] = collection_digest(
+                    manifest.get("version", ""),
+                    stale_ids,
+                    [chunk_id for chunk_id, _, _ in chunks],
+                )
+            # A file is only recorded once all of its chunks are stored
+            for path, entry in finished:
+                manifest["files"][path] = entry
+            dirty = True
+            if time.monotonic() - last_save > log_every:
+                save_manifest(manifest, manifest_path)
+                dirty = False
+                last_save = time.monotonic()
+        # After a failed write the manifest may already list files (or have
+        # dropped deleted ones) whose chunks were never added (or removed)
+        if dirty and not errors:
+            save_manifest(manifest, manifest_path)
+
+    writer_thread = threading.Thread(target=writer, daemon=True)
+    writer_thread.start()
+
+    # Chunks waiting to fill a batch, and the files they belong to together
+    # with the buffer offset at which each file's chunks end
+    stale_ids, chunks, finished = [], [], []
+    last_log = time.monotonic()
+
+    def flush(count: int):
+        nonlocal stale_ids, chunks, finished
+        done = [(path, entry) for path, entry, end in finished if end <= count]
+        finished = [
+            (path, entry, end - count) for path, entry, end in finished if end > count
+        ]
+        # Blocks when the writer falls behind, which in turn stops us from
+        # pulling more results out of the pool
+        writes.put((stale_ids, chunks[:count], done))
+        stale_ids, chunks = [], chunks[count:]
+
+    def collect(path, extract):
+        nonlocal last_log
+        stats.files += 1
+        try:
+            result = extract()
+        except Exception as e:
+            # An unreadable PDF keeps its old entry, so it is retried next run
+            stats.failed += 1
+            print(f"Skipping {path}: {e!r}")
+        else:
+            if result is None:
+                stats.skipped += 1
+            else:
+                stale_ids.extend(result["stale_ids"])
+                chunks.extend(result["chunks"])
+                finished.append((result["path"], result["entry"], len(chunks)))
+        while len(chunks) >= batch_size:
+            flush(batch_size)
+        if time.monotonic() - last_log > log_every:
+            print(stats.report(writes.qsize()))
+            last_log = time.monotonic()
+
+    # Files that were ingested before but no longer exist
+    for path in [
+        path
+        for path in manifest["files"]
+        if os.path.isabs(path) and not os.path.exists(path)
+    ]:
+        entry = manifest["files"].pop(path)
+        dirty = True
+        for page in entry["pages"].values():
+            stale_ids.extend(page["chunk_ids"])
+
+    try:
+        if workers == 0:
+            for path in paths:
+                entry = manifest["files"].get(path, {})
+                collect(path, lambda: extract_pdf(path, entry))
+        else:
+            workers = workers or os.cpu_count() or 1
+            # At most this many parsed PDFs are held in memory at once
+            max_pending = 2 * workers
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # Future -> the path it is extracting
+                pending = {}
+                for path in paths:
+                    if len(pending) >= max_pending:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            collect(pending.pop(future), future.result)
+                    entry = manifest["files"].get(path, {})
+                    pending[pool.submit(extract_pdf, path, entry)] = path
+                for future in wait(pending).done:
+                    collect(pending[future], future.result)
+
+        flush(len(chunks))
+    finally:
+        # Even when interrupted, let the writer store what it has and save
+        writes.put(None)
+        writer_thread.join()
+    if errors:
+        raise errors[0]
+    print(stats.report())
+    return stats
+
+
+def main():
+    from langchain_chroma import Chroma
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="A PDF file or a directory of PDFs")
+    parser.add_argument("--persist-directory", default=".")
+    parser.add_argument("--collection", default="stock_market")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=512)
+    args = parser.parse_args()
+
+    embeddings = HuggingFaceEmbeddings(
+        model_name="sentence-transformers/all-MiniLM-L6-v2",
+        encode_kwargs={"batch_size": 64},
+    )
+    vectorstore = Chroma(
+        persist_directory=args.persist_directory,
+        collection_name=args.collection,
+        embedding_function=embeddings,
+    )
+    manifest_path = os.path.join(
+        args.persist_directory, f"{args.collection}_manifest.json"
+    )
+    ingest_paths(
+        find_pdfs(args.source),
+        vectorstore,
+        manifest_path,
+        workers=args.workers,
+        batch_size=args.batch_size,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""A piece table: a text buffer that edits without copying the text.
+
+The document is a list of pieces, each a slice of an immutable buffer (the
+original text or one inserted string). Inserting or deleting only splits and
+rearranges pieces, so an edit costs the same on a one-page note and on a long
+report. Every piece also remembers how many newlines it holds, which makes
+line-number lookups cheap.
+"""
+
+
+class PieceTable:
+    def __init__(self, text: str = ""):
+        self._buffers = [text]
+        # (buffer index, start, length, newline count)
+        self._pieces = [(0, 0, len(text), text.count("\n"))] if text else []
+        self._length = len(text)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _split(self, offset: int) -> int:
+        """Split the piece at ``offset``; return the index of the piece starting there."""
+        if not 0 <= offset <= self._length:
+            raise IndexError(f"Offset {offset} is outside the document (0-{self._length})")
+        pos = 0
+        for i, (buffer, start, length, newlines) in enumerate(self._pieces):
+            if pos == offset:
+                return i
+            if offset < pos + length:
+                cut = offset - pos
+                left_newlines = self._buffers[buffer].count("\n", start, start + cut)
+                self._pieces[i : i + 1] = [
+                    (buffer, start, cut, left_newlines),
+                    (buffer, start + cut, length - cut, newlines - left_newlines),
+                ]
+                return i + 1
+            pos += length
+        return len(self._pieces)
+
+    def insert(self, offset: int, text: str):
+        if not text:
+            return
+        i = self._split(offset)
+        self._buffers.append(text)
+        self._pieces.insert(i, (len(self._buffers) - 1, 0, len(text), text.count("\n")))
+        self._length += len(text)
+
+    def delete(self, offset: int, length: int):
+        if length <= 0:
+            return
+        i = self._split(offset)
+        j = self._split(min(offset + length, self._length))
+        self._length -= sum(piece[2] for piece in self._pieces[i:j])
+        del self._pieces[i:j]
+
+    def replace(self, offset: int, length: int, text: str):
+        self.delete(offset, length)
+        self.insert(offset, text)
+
+    def chunks(self, start: int = 0, end: int | None = None):
+        """Yield the text between ``start`` and ``end`` piece by piece."""
+        end = self._length if end is None else end
+        pos = 0
+        for buffer, piece_start, length, _ in self._pieces:
+            if pos >= end:
+                break
+            if pos + length > start:
+                lo = max(start - pos, 0)
+                hi = min(end - pos, length)
+                yield self._buffers[buffer][piece_start + lo : piece_start + hi]
+            pos += length
+
+    def slice(self, start: int = 0, end: int | None = None) -> str:
+        return "".join(self.chunks(start, end))
+
+    def text(self) -> str:
+        return self.slice()
+
+    def find(self, needle: str, start: int = 0) -> int:
+        """Offset of the first ``needle`` at or after ``start``, or -1."""
+        if not needle:
+            return -1
+        keep = len(needle) - 1
+        # Text carried over from the previous piece, so matches spanning
+        # two pieces are found too
+        carry, carry_pos = "", start
+        for chunk in self.chunks(start):
+            window = carry + chunk
+            i = window.find(needle)
+            if i >= 0:
+                return carry_pos + i
+            carry = window[len(window) - keep :] if keep else ""
+            carry_pos += len(window) - len(carry)
+        return -1
+
+    def line_count(self) -> int:
+        return sum(piece[3] for piece in self._pieces) + 1
+
+    def line_offset(self, line: int) -> int:
+        """Offset at which 1-based ``line`` starts (the end for lines past it)."""
+        remaining = line - 1
+        if remaining <= 0:
+            return 0
+        pos = 0
+        for buffer, start, length, newlines in self._pieces:
+            if newlines >= remaining:
+                text = self._buffers[buffer]
+                i = start - 1
+                for _ in range(remaining):
+                    i = text.index("\n", i + 1)
+                return pos + i - start + 1
+            remaining -= newlines
+            pos += length
+        return self._length
+
+    def line_at(self, offset: int) -> int:
+        """1-based line number containing ``offset``."""
+        return sum(chunk.count("\n") for chunk in self.chunks(0, offset)) + 1
+
+    def lines(self, first: int, last: int) -> list[str]:
+        """Lines ``first`` to ``last`` inclusive, 1-based, without line endings."""
+        return self.slice(self.line_offset(first), self.line_offset(last + 1)).splitlines()
+
+    def iter_lines(self):
+        carry = ""
+        for chunk in self.chunks():
+            *complete, carry = (carry + chunk).split("\n")
+            yield from complete
+        yield carry